@@ -1,13 +1,1701 @@
+import time
+# El reloj del arranque empieza antes de importar nada: NumPy, Pillow y Tk
+# son la mayor parte del tiempo hasta el primer trazo
+_START_TIME = time.perf_counter()
+
 import tkinter as tk
 from tkinter import simpledialog, messagebox
-from PIL import Image, ImageTk, ImageDraw, ImageGrab
+from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageColor
+import argparse
+from array import array
+import bisect
+import copy
+import json
 import math
 import os
-import time
+import queue
+import random
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+__version__ = "0.0.1"
+
+# asyncio, multiprocessing, mmap, hashlib y zlib solo hacen falta en los
+# subcomandos y al exportar: se importan donde se usan para no retrasar la
+# ventana
+
+# ==============================================
+# Preprocesado de trazos
+# ==============================================
+
+def _resample_xy(xy, n):
+    steps = np.hypot(*np.diff(xy, axis=0).T)
+    arc = np.concatenate(([0.0], np.cumsum(steps)))
+    if arc[-1] == 0:
+        return np.repeat(xy[:1], n, axis=0)
+    targets = np.linspace(0.0, arc[-1], n)
+    return np.column_stack((np.interp(targets, arc, xy[:, 0]), np.interp(targets, arc, xy[:, 1])))
+
+
+def resample_stroke(points, n=64):
+    # Remuestrea el trazo a n puntos equiespaciados a lo largo de su longitud
+    xy = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(xy) == 0:
+        return []
+    return [tuple(p) for p in _resample_xy(xy, n).tolist()]
+
+
+def simplify_stroke(points, epsilon=2.0):
+    # Ramer–Douglas–Peucker iterativo: conserva los puntos que se alejan más
+    # de epsilon píxeles de la cuerda entre los puntos conservados
+    xy = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(xy) < 3:
+        return [tuple(p) for p in xy.tolist()]
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = xy[first], xy[last]
+        inner = xy[first + 1:last]
+        dx, dy = end - start
+        chord = math.hypot(dx, dy)
+        if chord == 0:
+            distances = np.hypot(inner[:, 0] - start[0], inner[:, 1] - start[1])
+        else:
+            distances = np.abs(dx * (inner[:, 1] - start[1]) - dy * (inner[:, 0] - start[0])) / chord
+        i = int(np.argmax(distances))
+        if distances[i] > epsilon:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [tuple(p) for p in xy[keep].tolist()]
+
+
+def convex_hull(points):
+    # Envolvente convexa (cadena monótona de Andrew), cerrada sobre sí misma
+    pts = sorted(set(map(tuple, points)))
+    if len(pts) < 3:
+        return pts
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    hull = lower[:-1] + upper[:-1]
+    return hull + hull[:1]
+
+
+class StrokePreprocessor:
+    # Etapa configurable antes del reconocimiento: primero simplifica con
+    # RDP (quita el temblor) y luego remuestrea a un número fijo de puntos,
+    # así el coste y los ángulos no dependen de la frecuencia del ratón.
+
+    def __init__(self, resample=64, epsilon=2.0):
+        self.resample = resample
+        self.epsilon = epsilon
+
+    def __call__(self, points):
+        if self.epsilon:
+            points = simplify_stroke(points, self.epsilon)
+        if self.resample:
+            points = resample_stroke(points, self.resample)
+        return points
+
+
+# ==============================================
+# Modelo del dibujo (varios trazos)
+# ==============================================
+
+def _clamp16(value):
+    return -32768 if value < -32768 else 32767 if value > 32767 else int(value)
+
+
+class Sketch:
+    # Dibujo de varios trazos en almacenamiento compacto: coordenadas int16
+    # en dos array('h') contiguos (4 bytes por punto) y el índice de inicio de
+    # cada trazo. Deshacer un trazo trunca los arrays en su sitio, sin copiar.
+
+    __slots__ = ("xs", "ys", "starts")
+
+    def __init__(self):
+        self.xs = array('h')
+        self.ys = array('h')
+        self.starts = array('I')
+
+    def __len__(self):
+        return len(self.xs)
+
+    @property
+    def stroke_count(self):
+        return len(self.starts)
+
+    def begin_stroke(self, x, y):
+        self.starts.append(len(self.xs))
+        self.add_point(x, y)
+
+    def add_point(self, x, y):
+        self.xs.append(_clamp16(x))
+        self.ys.append(_clamp16(y))
+
+    def undo(self):
+        # Quita el último trazo; devuelve False si no había ninguno
+        if not self.starts:
+            return False
+        start = self.starts.pop()
+        del self.xs[start:]
+        del self.ys[start:]
+        return True
+
+    def clear(self):
+        del self.xs[:]
+        del self.ys[:]
+        del self.starts[:]
+
+    def stroke(self, index):
+        start = self.starts[index]
+        end = self.starts[index + 1] if index + 1 < len(self.starts) else len(self.xs)
+        return list(zip(self.xs[start:end], self.ys[start:end]))
+
+    def strokes(self):
+        return [self.stroke(i) for i in range(len(self.starts))]
+
+    def points(self):
+        # Todos los puntos del dibujo como lista de tuplas (x, y)
+        return list(zip(self.xs, self.ys))
+
+    def snapshot(self):
+        # Copia barata de las coordenadas (un memcpy de cada array) para
+        # pasarla a otro hilo; los puntos se construyen allí con snapshot_points
+        return bytes(self.xs), bytes(self.ys)
+
+    @staticmethod
+    def snapshot_points(snapshot):
+        xs, ys = array('h'), array('h')
+        xs.frombytes(snapshot[0])
+        ys.frombytes(snapshot[1])
+        return list(zip(xs, ys))
+
+    def as_array(self):
+        # Matriz (n, 2) de int16 con todos los puntos
+        return np.column_stack((np.frombuffer(self.xs, dtype=np.int16),
+                                np.frombuffer(self.ys, dtype=np.int16)))
+
+
+# ==============================================
+# Instrumentación de latencia (opcional)
+# ==============================================
+
+class LatencyMetrics:
+    # Histogramas de latencia por nombre y medidores sueltos. Solo se usa si
+    # se activa: los manejadores se envuelven con wrap() al crear la app, así
+    # que desactivado no añade ni una comprobación al camino caliente.
+
+    BUCKETS_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, elapsed_ns):
+        us = elapsed_ns / 1000
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = {"count": 0, "total_us": 0.0, "max_us": 0.0,
+                                                "buckets": [0] * (len(self.BUCKETS_US) + 1)}
+            hist["count"] += 1
+            hist["total_us"] += us
+            if us > hist["max_us"]:
+                hist["max_us"] = us
+            hist["buckets"][bisect.bisect_left(self.BUCKETS_US, us)] += 1
+
+    def wrap(self, name, function):
+        clock = time.perf_counter_ns
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, clock() - start)
+        return timed
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def _percentile(self, hist, fraction):
+        # Límite superior de la casilla que contiene el percentil
+        target = hist["count"] * fraction
+        seen = 0
+        for bound, count in zip(self.BUCKETS_US + (hist["max_us"],), hist["buckets"]):
+            seen += count
+            if seen >= target:
+                return min(bound, hist["max_us"])
+        return hist["max_us"]
+
+    def snapshot(self):
+        with self.lock:
+            latency = {}
+            for name, hist in self.histograms.items():
+                latency[name] = {
+                    "count": hist["count"],
+                    "mean_us": hist["total_us"] / hist["count"],
+                    "p50_us": self._percentile(hist, 0.5),
+                    "p95_us": self._percentile(hist, 0.95),
+                    "max_us": hist["max_us"],
+                    "buckets_us": dict(zip([str(b) for b in self.BUCKETS_US] + ["inf"], hist["buckets"])),
+                }
+        return {"latency": latency, "gauges": dict(self.gauges)}
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"{name:18} n={s['count']:<6} p50={s['p50_us'] / 1000:7.2f} ms  "
+                 f"p95={s['p95_us'] / 1000:7.2f} ms  max={s['max_us'] / 1000:7.2f} ms"
+                 for name, s in sorted(snapshot["latency"].items())]
+        lines += [f"{name:18} {value}" for name, value in sorted(snapshot["gauges"].items())]
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+# ==============================================
+# Motor de reconocimiento (independiente de Tk)
+# ==============================================
+
+class PointGrid:
+    # Índice espacial de rejilla uniforme para búsquedas de vecinos.
+    # Se construye una vez por trazo; cada celda mide lo mismo que el radio
+    # de búsqueda, así que basta mirar las 3x3 celdas alrededor del punto.
+
+    def __init__(self, points, cell_size=20):
+        self.cell_size = cell_size
+        self.cells = {}
+        for x, y in points:
+            key = (math.floor(x / cell_size), math.floor(y / cell_size))
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [(x, y)]
+            else:
+                bucket.append((x, y))
+
+    def neighbors(self, x, y, radius=None):
+        # Puntos con |px - x| < radius y |py - y| < radius
+        radius = self.cell_size if radius is None else radius
+        reach = math.ceil(radius / self.cell_size)
+        cx, cy = math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                for px, py in self.cells.get((i, j), ()):
+                    if abs(px - x) < radius and abs(py - y) < radius:
+                        yield px, py
+
+    def has_neighbor(self, x, y, radius=None):
+        for _ in self.neighbors(x, y, radius):
+            return True
+        return False
+
+
+class TemplateRecognizer:
+    # Reconocedor por plantillas al estilo $1/Protractor. Cada objeto se
+    # normaliza una vez (remuestreo a n puntos, centrado en el centroide y
+    # vector de longitud 1) y todas las variantes se empaquetan en una matriz.
+    # Un trazo se compara con todas a la vez con dos productos matriz-vector;
+    # antes se descartan las plantillas con una proporción muy distinta.
+
+    def __init__(self, n=64, shifts=16, max_rotation=20, max_aspect_ratio=3.0):
+        self.n = n
+        self.shifts = shifts                            # puntos de inicio distintos por plantilla
+        self.max_rotation = math.radians(max_rotation)  # giro permitido (sensible a la orientación)
+        self.max_log_aspect = math.log(max_aspect_ratio)
+        self.names = []
+        self._rows = []
+        self._log_aspects = []
+        self._matrix = None
+
+    def normalize(self, points):
+        # Vector (x1, y1, x2, y2, ...) de longitud 1 o None si el trazo es un punto
+        xy = _resample_xy(np.asarray(points, dtype=np.float64).reshape(-1, 2), self.n)
+        return self._normalized(xy)
+
+    @staticmethod
+    def _normalized(xy):
+        xy = xy - xy.mean(axis=0)
+        vector = xy.ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    @staticmethod
+    def _log_aspect(xy):
+        width, height = xy.max(axis=0) - xy.min(axis=0) + 1.0
+        return math.log(width / height)
+
+    def add_template(self, name, points):
+        # Añade el trazo en ambos sentidos y empezando en varios puntos
+        xy = _resample_xy(np.asarray(points, dtype=np.float64).reshape(-1, 2), self.n)
+        log_aspect = self._log_aspect(xy)
+        for variant in (xy, xy[::-1]):
+            for shift in range(self.shifts):
+                vector = self._normalized(np.roll(variant, -shift * self.n // self.shifts, axis=0))
+                if vector is not None:
+                    self.names.append(name)
+                    self._rows.append(vector)
+                    self._log_aspects.append(log_aspect)
+        self._matrix = None
+
+    def _packed(self):
+        if self._matrix is None:
+            if not self._rows:
+                # Cada objeto entra con su contorno completo y con su silueta
+                # (envolvente convexa), que es como se suele garabatear
+                for name in TEMPLATES:
+                    outline = template_display_list(name).outline()
+                    self.add_template(name, outline)
+                    self.add_template(name, convex_hull(outline))
+            # Filas ordenadas por proporción: el rechazo temprano es un corte
+            # contiguo de la matriz (una vista, sin copiar)
+            order = np.argsort(self._log_aspects, kind="stable")
+            self._classes = sorted(set(self.names), key=self.names.index)
+            class_index = {name: i for i, name in enumerate(self._classes)}
+            self._matrix = np.vstack(self._rows)[order]
+            self._aspects = np.array(self._log_aspects)[order]
+            self._labels = np.array([class_index[name] for name in self.names])[order]
+        return self._matrix
+
+    def prepare(self):
+        # Compila la matriz de plantillas por adelantado (si no, se hace en el primer trazo)
+        self._packed()
+
+    def recognize(self, points, top=3):
+        # [(nombre, puntuación), ...] de mayor a menor; 1.0 es idéntico
+        if len(points) < 3:
+            return []
+        matrix = self._packed()
+        xy = np.array(points, dtype=np.float64).reshape(-1, 2)
+        vector = self._normalized(_resample_xy(xy, self.n))
+        if vector is None:
+            return []
+
+        # Rechazo temprano por proporción de la caja
+        log_aspect = self._log_aspect(xy)
+        first, last = np.searchsorted(self._aspects, (log_aspect - self.max_log_aspect,
+                                                      log_aspect + self.max_log_aspect + 1e-12))
+        if first == last:
+            return []
+        rows = matrix[first:last]
+
+        # Protractor: mejor giro en forma cerrada, limitado a ±max_rotation
+        perpendicular = np.empty_like(vector)
+        perpendicular[0::2] = vector[1::2]
+        perpendicular[1::2] = -vector[0::2]
+        a = rows @ vector
+        b = rows @ perpendicular
+        angle = np.clip(np.arctan2(b, a), -self.max_rotation, self.max_rotation)
+        scores = np.clip(a * np.cos(angle) + b * np.sin(angle), 0.0, 1.0)
+
+        # Mejor variante de cada objeto
+        order = np.argsort(-scores)
+        labels, firsts = np.unique(self._labels[first:last][order], return_index=True)
+        ranked = sorted(zip(scores[order[firsts]].tolist(), labels.tolist()), reverse=True)[:top]
+        return [(self._classes[label], score) for score, label in ranked]
+
+    def recognize_batch(self, strokes, top=3):
+        return [self.recognize(points, top) for points in strokes]
+
+
+class FeatureAccumulator:
+    # Características de un trazo acumuladas punto a punto mientras se dibuja:
+    # caja, sumas para el centroide, histograma de ángulos de giro y
+    # contadores de giros. Cada add() es O(1).
+
+    ANGLE_BIN = 10  # grados por casilla del histograma
+
+    def __init__(self, points=()):
+        self.reset()
+        for x, y in points:
+            self.add(x, y)
+
+    def reset(self):
+        self.count = 0
+        self.min_x = self.max_x = self.min_y = self.max_y = 0
+        self.sum_x = self.sum_y = 0
+        self.angle_histogram = [0] * (180 // self.ANGLE_BIN)
+        self.right_angles = 0   # 70° < a < 110°
+        self.sharp_60 = 0       # a < 60°
+        self.sharp_45 = 0       # a < 45°
+        self._prev = None
+        self._last = None
+
+    def copy(self):
+        clone = copy.copy(self)
+        clone.angle_histogram = list(self.angle_histogram)
+        return clone
+
+    def break_stroke(self):
+        # Empieza un trazo nuevo: los ángulos no cruzan de un trazo a otro
+        self._prev = None
+        self._last = None
+
+    def add_sketch(self, sketch):
+        for stroke in sketch.strokes():
+            self.break_stroke()
+            for x, y in stroke:
+                self.add(x, y)
+
+    def add(self, x, y):
+        if self.count == 0:
+            self.min_x = self.max_x = x
+            self.min_y = self.max_y = y
+        else:
+            if x < self.min_x:
+                self.min_x = x
+            elif x > self.max_x:
+                self.max_x = x
+            if y < self.min_y:
+                self.min_y = y
+            elif y > self.max_y:
+                self.max_y = y
+        self.count += 1
+        self.sum_x += x
+        self.sum_y += y
+
+        # El ángulo del punto anterior ya se puede calcular
+        if self._prev is not None:
+            x1, y1 = self._prev
+            x2, y2 = self._last
+            angle = math.degrees(math.atan2(y-y2, x-x2) - math.atan2(y1-y2, x1-x2))
+            angle = abs(angle)
+            if angle > 180:
+                angle = 360 - angle
+            self._add_angle(angle)
+        self._prev = self._last
+        self._last = (x, y)
+
+    def _add_angle(self, angle):
+        self.angle_histogram[min(int(angle // self.ANGLE_BIN), len(self.angle_histogram) - 1)] += 1
+        if 70 < angle < 110:
+            self.right_angles += 1
+        if angle < 60:
+            self.sharp_60 += 1
+            if angle < 45:
+                self.sharp_45 += 1
+
+    @property
+    def centroid(self):
+        return self.sum_x / self.count, self.sum_y / self.count
+
+    def features(self, points):
+        # Todo sale de los acumuladores salvo la circularidad, que depende del
+        # centroide final y necesita una pasada vectorizada sobre los puntos.
+        width = self.max_x - self.min_x
+        height = self.max_y - self.min_y
+        aspect_ratio = width / height if height != 0 else 1
+
+        centroid_x, centroid_y = self.centroid
+        xy = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distances = np.hypot(xy[:, 0] - centroid_x, xy[:, 1] - centroid_y)
+        circularity = float(np.abs(distances - distances.mean()).mean())
+
+        return {
+            "points": self.count,
+            "min_x": self.min_x, "max_x": self.max_x, "min_y": self.min_y, "max_y": self.max_y,
+            "width": width, "height": height,
+            "aspect_ratio": aspect_ratio,
+            "centroid_x": centroid_x, "centroid_y": centroid_y,
+            "circularity": circularity,
+            "angle_histogram": list(self.angle_histogram),
+            "right_angles": self.right_angles,
+            "sharp_turns": self.sharp_60,
+        }
+
+
+class DrawinRecognizer:
+    # Reglas geométricas de Drawin sobre listas de puntos (x, y).
+    # No necesita una ventana Tk, así que sirve para procesar trazos en lote.
+
+    # Solo lo que analyze llama de verdad; las características se miden
+    # dentro de analyze como "stroke_features"
+    DETECTORS = ("is_house_shape", "is_star_shape", "is_heart_shape", "is_balloon_shape",
+                 "is_fish_shape")
+
+    def __init__(self, preprocessor=None, metrics=None):
+        self.preprocessor = preprocessor
+        self.metrics = metrics
+        if metrics:
+            # Medir cada detector por separado sin tocar el código de las reglas
+            for name in self.DETECTORS:
+                setattr(self, name, metrics.wrap(name, getattr(self, name)))
+
+    def analyze(self, points, accumulator=None):
+        # Devuelve (adivinanza, características); (None, None) si el trazo es muy corto.
+        # Si se pasa el acumulador que se llenó mientras se dibujaba, no hace
+        # falta recorrer el trazo otra vez para la caja ni para los ángulos.
+        if len(points) < 3:
+            return None, None
+        if self.preprocessor:
+            # El acumulador se llenó con el trazo en bruto; ya no sirve
+            points = self.preprocessor(points)
+            accumulator = None
+        if accumulator is None:
+            accumulator = FeatureAccumulator(points)
+
+        if self.metrics:
+            start = time.perf_counter_ns()
+            features = accumulator.features(points)
+            self.metrics.record("stroke_features", time.perf_counter_ns() - start)
+        else:
+            features = accumulator.features(points)
+        aspect_ratio = features["aspect_ratio"]
+        circularity = features["circularity"]
+
+        # Detección de formas mejorada
+        guess = None
+        if circularity < 15 and 0.7 < aspect_ratio < 1.3:
+            guess = "sol"
+        elif circularity < 20 and aspect_ratio > 1.5:
+            guess = "coche"
+        elif circularity < 20 and aspect_ratio < 0.7:
+            guess = "árbol"
+        elif self.is_house_shape(points, accumulator):
+            guess = "casa"
+        elif self.is_star_shape(points, accumulator):
+            guess = "estrella"
+        elif self.is_heart_shape(points):
+            guess = "corazón"
+        elif self.is_balloon_shape(points):
+            guess = "globo"
+        elif self.is_fish_shape(points, accumulator):
+            guess = "pez"
+        return guess, features
+
+    def features(self, points):
+        return FeatureAccumulator(points).features(points)
+
+    def is_house_shape(self, points, accumulator=None):
+        if len(points) < 10:
+            return False
+
+        accumulator = accumulator or FeatureAccumulator(points)
+        return accumulator.right_angles >= 2
+
+    def is_star_shape(self, points, accumulator=None):
+        if len(points) < 10:
+            return False
+
+        accumulator = accumulator or FeatureAccumulator(points)
+        return accumulator.sharp_60 >= 5
+
+    def is_heart_shape(self, points, index=None):
+        if len(points) < 10:
+            return False
+
+        # Verificar simetría aproximada
+        centroid_x = sum(p[0] for p in points) / len(points)
+        threshold = 20
+        if index is None:
+            index = PointGrid(points, threshold)
+
+        # Buscar un punto cercano al punto espejo
+        symmetric_points = sum(1 for x, y in points
+                               if index.has_neighbor(2 * centroid_x - x, y, threshold))
+
+        return symmetric_points / len(points) > 0.6
+
+    def is_balloon_shape(self, points):
+        if len(points) < 5:
+            return False
+
+        # Verificar si tiene una parte ovalada arriba y una línea abajo
+        mean_y = sum(p[1] for p in points) / len(points)
+        upper_points = [p for p in points if p[1] < mean_y]
+        if len(upper_points) < 3:
+            return False
+
+        # Calcular circularidad solo para la parte superior
+        centroid_x = sum(p[0] for p in upper_points) / len(upper_points)
+        centroid_y = sum(p[1] for p in upper_points) / len(upper_points)
+        distances = [math.sqrt((p[0]-centroid_x)**2 + (p[1]-centroid_y)**2) for p in upper_points]
+        avg_distance = sum(distances) / len(distances)
+        circularity = sum(abs(d - avg_distance) for d in distances) / len(distances)
+
+        return circularity < 25
+
+    def is_fish_shape(self, points, accumulator=None):
+        if len(points) < 10:
+            return False
+
+        # Verificar si tiene una cola (punto donde cambia bruscamente la dirección)
+        accumulator = accumulator or FeatureAccumulator(points)
+        return 1 <= accumulator.sharp_45 <= 3
+
+    def calculate_angles(self, points):
+        angles = []
+        for i in range(1, len(points)-1):
+            x1, y1 = points[i-1]
+            x2, y2 = points[i]
+            x3, y3 = points[i+1]
+
+            angle = math.degrees(math.atan2(y3-y2, x3-x2) - math.atan2(y1-y2, x1-x2))
+            angle = abs(angle)
+            if angle > 180:
+                angle = 360 - angle
+            angles.append(angle)
+        return angles
+
+    # ----------------------------------------------
+    # Procesamiento por lotes con NumPy
+    # ----------------------------------------------
+
+    def batch_features(self, strokes):
+        # Características de muchos trazos a la vez. Los trazos se empaquetan en
+        # un único array plano y se reducen por segmentos con reduceat.
+        lengths = np.fromiter((len(s) for s in strokes), dtype=np.int64, count=len(strokes))
+        if lengths.size == 0 or (lengths == 0).any():
+            raise ValueError("batch_features necesita trazos no vacíos")
+        offsets = np.zeros(lengths.size, dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        flat = np.concatenate([np.asarray(s, dtype=np.float64).reshape(-1, 2) for s in strokes])
+        xs, ys = flat[:, 0], flat[:, 1]
+
+        min_x = np.minimum.reduceat(xs, offsets)
+        max_x = np.maximum.reduceat(xs, offsets)
+        min_y = np.minimum.reduceat(ys, offsets)
+        max_y = np.maximum.reduceat(ys, offsets)
+        width = max_x - min_x
+        height = max_y - min_y
+        aspect_ratio = np.divide(width, height, out=np.ones_like(width), where=height != 0)
+
+        centroid_x = np.add.reduceat(xs, offsets) / lengths
+        centroid_y = np.add.reduceat(ys, offsets) / lengths
+        distances = np.hypot(xs - np.repeat(centroid_x, lengths), ys - np.repeat(centroid_y, lengths))
+        avg_distance = np.add.reduceat(distances, offsets) / lengths
+        circularity = np.add.reduceat(np.abs(distances - np.repeat(avg_distance, lengths)), offsets) / lengths
+
+        # Ángulos de giro: un ángulo por cada punto interior de cada trazo
+        angles = np.full(xs.size, np.nan)
+        if xs.size > 2:
+            a = np.arctan2(ys[2:] - ys[1:-1], xs[2:] - xs[1:-1])
+            b = np.arctan2(ys[:-2] - ys[1:-1], xs[:-2] - xs[1:-1])
+            turn = np.abs(np.degrees(a - b))
+            angles[1:-1] = np.where(turn > 180, 360 - turn, turn)
+        # Los extremos de cada trazo no tienen ángulo
+        angles[offsets] = np.nan
+        angles[offsets + lengths - 1] = np.nan
+
+        return {
+            "points": lengths, "offsets": offsets,
+            "min_x": min_x, "max_x": max_x, "min_y": min_y, "max_y": max_y,
+            "width": width, "height": height,
+            "aspect_ratio": aspect_ratio,
+            "centroid_x": centroid_x, "centroid_y": centroid_y,
+            "circularity": circularity,
+            "angles": angles,
+        }
+
+    def analyze_batch(self, strokes):
+        # Igual que analyze() para cada trazo; las reglas de bbox, circularidad
+        # y ángulos se evalúan vectorizadas y solo corazón/globo van trazo a trazo.
+        guesses = [None] * len(strokes)
+        valid = [i for i, s in enumerate(strokes) if len(s) >= 3]
+        if self.preprocessor:
+            strokes = [self.preprocessor(s) if len(s) >= 3 else s for s in strokes]
+        if not valid:
+            return guesses
+        features = self.batch_features([strokes[i] for i in valid])
+        lengths = features["points"]
+        offsets = features["offsets"]
+        aspect_ratio = features["aspect_ratio"]
+        circularity = features["circularity"]
+
+        with np.errstate(invalid="ignore"):
+            angles = features["angles"]
+            right_angles = np.add.reduceat((angles > 70) & (angles < 110), offsets)
+            sharp_60 = np.add.reduceat(angles < 60, offsets)
+            sharp_45 = np.add.reduceat(angles < 45, offsets)
+
+        long_enough = lengths >= 10
+        rules = [
+            ("sol", (circularity < 15) & (aspect_ratio > 0.7) & (aspect_ratio < 1.3)),
+            ("coche", (circularity < 20) & (aspect_ratio > 1.5)),
+            ("árbol", (circularity < 20) & (aspect_ratio < 0.7)),
+            ("casa", long_enough & (right_angles >= 2)),
+            ("estrella", long_enough & (sharp_60 >= 5)),
+        ]
+        for k, i in enumerate(valid):
+            for name, mask in rules:
+                if mask[k]:
+                    guesses[i] = name
+                    break
+            else:
+                points = strokes[i]
+                if self.is_heart_shape(points):
+                    guesses[i] = "corazón"
+                elif self.is_balloon_shape(points):
+                    guesses[i] = "globo"
+                elif long_enough[k] and 1 <= sharp_45[k] <= 3:
+                    guesses[i] = "pez"
+        return guesses
+
+
+# ==============================================
+# Funciones de dibujo para todos los objetos
+# ==============================================
+# Reciben cualquier superficie con la API de tk.Canvas (create_oval,
+# create_line, ...): el lienzo Tk o un ImageCanvas en memoria.
+
+def draw_sun(canvas):
+    canvas.create_oval(150, 150, 350, 350, fill='yellow', outline='orange', width=2)
+    for i in range(0, 360, 30):
+        rad = math.radians(i)
+        x1 = 250 + 110 * math.cos(rad)
+        y1 = 250 + 110 * math.sin(rad)
+        x2 = 250 + 140 * math.cos(rad)
+        y2 = 250 + 140 * math.sin(rad)
+        canvas.create_line(x1, y1, x2, y2, width=3, fill='orange')
+
+
+def draw_moon(canvas):
+    canvas.create_oval(175, 150, 325, 300, fill='#f0f0f0', outline='gray', width=2)
+    canvas.create_oval(200, 150, 300, 300, fill='white', outline='white')
+
+
+def draw_house(canvas):
+    # Base de la casa
+    canvas.create_rectangle(175, 250, 325, 350, fill='#FFD700', outline='brown', width=2)
+    # Techo
+    canvas.create_polygon(160, 250, 340, 250, 250, 170, fill='red', outline='brown', width=2)
+    # Puerta
+    canvas.create_rectangle(230, 280, 270, 350, fill='brown', outline='black', width=1)
+    # Ventanas
+    canvas.create_rectangle(190, 270, 220, 300, fill='#87CEEB', outline='black', width=1)
+    canvas.create_rectangle(280, 270, 310, 300, fill='#87CEEB', outline='black', width=1)
+
+
+def draw_tree(canvas):
+    # Tronco
+    canvas.create_rectangle(235, 300, 265, 350, fill='brown', outline='black', width=1)
+    # Copa
+    canvas.create_oval(150, 200, 350, 300, fill='green', outline='darkgreen', width=2)
+
+
+def draw_car(canvas):
+    # Cuerpo
+    canvas.create_rectangle(150, 250, 350, 280, fill='red', outline='black', width=2)
+    canvas.create_rectangle(180, 230, 320, 250, fill='red', outline='black', width=2)
+    # Ruedas
+    canvas.create_oval(160, 270, 190, 300, fill='black')
+    canvas.create_oval(310, 270, 340, 300, fill='black')
+
+
+def draw_person(canvas):
+    # Cabeza
+    canvas.create_oval(225, 150, 275, 200, fill='#FFD699', outline='black', width=1)
+    # Cuerpo
+    canvas.create_line(250, 200, 250, 275, width=2)
+    # Brazos
+    canvas.create_line(250, 225, 190, 240, width=2)
+    canvas.create_line(250, 225, 310, 240, width=2)
+    # Piernas
+    canvas.create_line(250, 275, 220, 320, width=2)
+    canvas.create_line(250, 275, 280, 320, width=2)
+
+
+def draw_cat(canvas):
+    # Cabeza
+    canvas.create_oval(200, 180, 300, 280, fill='gray', outline='black', width=1)
+    # Orejas
+    canvas.create_polygon(210, 180, 230, 140, 250, 180, fill='gray', outline='black', width=1)
+    canvas.create_polygon(250, 180, 270, 140, 290, 180, fill='gray', outline='black', width=1)
+    # Ojos
+    canvas.create_oval(225, 210, 235, 220, fill='green', outline='black', width=1)
+    canvas.create_oval(265, 210, 275, 220, fill='green', outline='black', width=1)
+    # Nariz y boca
+    canvas.create_polygon(245, 230, 255, 230, 250, 240, fill='pink', outline='black', width=1)
+    canvas.create_line(250, 240, 250, 250, width=1)
+    canvas.create_line(250, 250, 230, 260, width=1)
+    canvas.create_line(250, 250, 270, 260, width=1)
+
+
+def draw_dog(canvas):
+    # Cabeza
+    canvas.create_oval(200, 180, 300, 280, fill='#8B4513', outline='black', width=1)
+    # Orejas
+    canvas.create_oval(200, 180, 240, 220, fill='#8B4513', outline='black', width=1)
+    canvas.create_oval(260, 180, 300, 220, fill='#8B4513', outline='black', width=1)
+    # Ojos
+    canvas.create_oval(225, 210, 235, 220, fill='black')
+    canvas.create_oval(265, 210, 275, 220, fill='black')
+    # Nariz
+    canvas.create_oval(245, 230, 255, 240, fill='black')
+    # Boca
+    canvas.create_line(250, 240, 250, 250, width=1)
+    canvas.create_line(250, 250, 230, 255, width=1)
+    canvas.create_line(250, 250, 270, 255, width=1)
+
+
+def draw_flower(canvas):
+    # Tallo
+    canvas.create_line(250, 250, 250, 350, fill='green', width=3)
+    # Hojas
+    canvas.create_oval(200, 270, 230, 300, fill='green', outline='darkgreen', width=1)
+    canvas.create_oval(270, 300, 300, 330, fill='green', outline='darkgreen', width=1)
+    # Flor
+    canvas.create_oval(200, 200, 300, 300, fill='yellow', outline='orange', width=2)
+    for i in range(0, 360, 45):
+        rad = math.radians(i)
+        x1 = 250 + 50 * math.cos(rad)
+        y1 = 250 + 50 * math.sin(rad)
+        x2 = 250 + 80 * math.cos(rad)
+        y2 = 250 + 80 * math.sin(rad)
+        canvas.create_line(x1, y1, x2, y2, width=3, fill='pink')
+
+
+def draw_star(canvas):
+    points = []
+    for i in range(5):
+        # Puntos externos
+        angle = math.radians(90 + i * 72)
+        x = 250 + 80 * math.cos(angle)
+        y = 250 + 80 * math.sin(angle)
+        points.extend([x, y])
+        
+        # Puntos internos
+        angle = math.radians(90 + 36 + i * 72)
+        x = 250 + 30 * math.cos(angle)
+        y = 250 + 30 * math.sin(angle)
+        points.extend([x, y])
+        
+    canvas.create_polygon(points, fill='yellow', outline='gold', width=2)
+
+
+def draw_heart(canvas):
+    points = []
+    for t in range(0, 628, 10):  # 0 a 2π en pasos de 0.1 radianes
+        t = t / 100
+        x = 250 + 16 * math.sin(t)**3
+        y = 250 - (13 * math.cos(t) - 5 * math.cos(2*t) - 2 * math.cos(3*t) - math.cos(4*t))
+        points.extend([x, y])
+    
+    canvas.create_polygon(points, fill='red', outline='darkred', width=2)
+
+
+def draw_balloon(canvas):
+    # Globo
+    canvas.create_oval(200, 150, 300, 250, fill='red', outline='darkred', width=2)
+    # Cuerda
+    canvas.create_line(250, 250, 250, 300, fill='gray', width=1)
+    # Canasta
+    canvas.create_rectangle(230, 300, 270, 310, fill='brown', outline='black', width=1)
+
+
+def draw_fish(canvas):
+    # Cuerpo
+    canvas.create_oval(200, 200, 300, 250, fill='orange', outline='black', width=1)
+    # Cola
+    canvas.create_polygon(300, 225, 330, 200, 330, 250, fill='orange', outline='black', width=1)
+    # Ojo
+    canvas.create_oval(210, 215, 220, 225, fill='black')
+    # Aletas
+    canvas.create_polygon(230, 225, 250, 210, 270, 225, fill='orange', outline='black', width=1)
+    canvas.create_polygon(230, 225, 250, 240, 270, 225, fill='orange', outline='black', width=1)
+
+
+def draw_butterfly(canvas):
+    # Cuerpo
+    canvas.create_line(250, 200, 250, 300, fill='black', width=3)
+    # Alas superiores
+    canvas.create_oval(150, 150, 250, 250, fill='purple', outline='black', width=1)
+    canvas.create_oval(250, 150, 350, 250, fill='purple', outline='black', width=1)
+    # Alas inferiores
+    canvas.create_oval(170, 220, 250, 300, fill='blue', outline='black', width=1)
+    canvas.create_oval(250, 220, 330, 300, fill='blue', outline='black', width=1)
+    # Antenas
+    canvas.create_line(250, 200, 230, 170, fill='black', width=1)
+    canvas.create_line(250, 200, 270, 170, fill='black', width=1)
+
+
+def draw_boat(canvas):
+    # Casco
+    canvas.create_polygon(200, 300, 300, 300, 280, 270, 220, 270, fill='brown', outline='black', width=2)
+    # Vela
+    canvas.create_polygon(250, 270, 250, 200, 300, 270, fill='white', outline='black', width=1)
+    # Mástil
+    canvas.create_line(250, 270, 250, 180, fill='brown', width=3)
+    # Bandera
+    canvas.create_rectangle(250, 180, 270, 190, fill='red', outline='black', width=1)
+
+
+# Objetos reconocibles ampliados (15 objetos)
+TEMPLATES = {
+    "sol": draw_sun,
+    "luna": draw_moon,
+    "casa": draw_house,
+    "árbol": draw_tree,
+    "coche": draw_car,
+    "persona": draw_person,
+    "gato": draw_cat,
+    "perro": draw_dog,
+    "flor": draw_flower,
+    "estrella": draw_star,
+    "corazón": draw_heart,
+    "globo": draw_balloon,
+    "pez": draw_fish,
+    "mariposa": draw_butterfly,
+    "barco": draw_boat,
+}
+
+
+# ==============================================
+# Listas de visualización de las plantillas
+# ==============================================
+
+class RecordingCanvas:
+    # Graba las llamadas create_* como primitivas en lugar de dibujarlas
+
+    def __init__(self):
+        self.primitives = []
+
+    def _record(self, kind, coords, options):
+        self.primitives.append((kind, tuple(_flatten_coords(coords)), options))
+
+    def create_line(self, *coords, **options):
+        self._record('line', coords, options)
+
+    def create_oval(self, *coords, **options):
+        self._record('oval', coords, options)
+
+    def create_rectangle(self, *coords, **options):
+        self._record('rectangle', coords, options)
+
+    def create_polygon(self, *coords, **options):
+        self._record('polygon', coords, options)
+
+    def create_text(self, *coords, **options):
+        self._record('text', coords, options)
+
+
+class DisplayList:
+    # Primitivas (tipo, coordenadas, estilo) de una plantilla ya evaluadas.
+    # Se reproducen con una transformación (sx, sy, dx, dy) sobre cualquier
+    # superficie con la API de tk.Canvas, sin volver a calcular la geometría.
+
+    IDENTITY = (1.0, 1.0, 0.0, 0.0)
+
+    def __init__(self, primitives):
+        self.primitives = primitives
+        xs = [c for _, coords, _ in primitives for c in coords[0::2]]
+        ys = [c for _, coords, _ in primitives for c in coords[1::2]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    @classmethod
+    def record(cls, draw_function):
+        recorder = RecordingCanvas()
+        draw_function(recorder)
+        return cls(recorder.primitives)
+
+    def fit(self, bbox, min_size=20):
+        # Transformación uniforme que centra la plantilla en bbox. Las
+        # dimensiones menores que min_size (p. ej. una línea) no limitan la
+        # escala; si no queda ninguna, la plantilla se deja como está.
+        x1, y1, x2, y2 = self.bbox
+        bx1, by1, bx2, by2 = bbox
+        ratios = [(bx2 - bx1) / (x2 - x1) if bx2 - bx1 >= min_size and x2 > x1 else None,
+                  (by2 - by1) / (y2 - y1) if by2 - by1 >= min_size and y2 > y1 else None]
+        ratios = [r for r in ratios if r is not None]
+        if not ratios:
+            return self.IDENTITY
+        scale = min(ratios)
+        dx = (bx1 + bx2) / 2 - scale * (x1 + x2) / 2
+        dy = (by1 + by2) / 2 - scale * (y1 + y2) / 2
+        return (scale, scale, dx, dy)
+
+    def outline(self, oval_samples=32):
+        # Contorno de todas las primitivas encadenado como un único trazo,
+        # en el orden en que se dibujan (las elipses se muestrean)
+        points = []
+        for kind, coords, _ in self.primitives:
+            if kind == 'oval':
+                x1, y1, x2, y2 = coords
+                cx, cy, rx, ry = (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 2, (y2 - y1) / 2
+                for i in range(oval_samples + 1):
+                    t = 2 * math.pi * i / oval_samples
+                    points.append((cx + rx * math.cos(t), cy + ry * math.sin(t)))
+            elif kind == 'rectangle':
+                x1, y1, x2, y2 = coords
+                points.extend([(x1, y1), (x2, y1), (x2, y2), (x1, y2), (x1, y1)])
+            elif kind == 'polygon':
+                vertices = list(zip(coords[0::2], coords[1::2]))
+                points.extend(vertices + vertices[:1])
+            elif kind == 'line':
+                points.extend(zip(coords[0::2], coords[1::2]))
+        return points
+
+    def replay(self, canvas, transform=IDENTITY):
+        return replay_primitives(self.primitives, canvas, transform)
+
+
+def replay_primitives(primitives, canvas, transform=DisplayList.IDENTITY):
+    # Dibuja primitivas en cualquier superficie con la API de tk.Canvas
+    # aplicando (sx, sy, dx, dy); devuelve lo que devuelvan los create_*
+    sx, sy, dx, dy = transform
+    stroke_scale = math.sqrt(abs(sx * sy))
+    items = []
+    for kind, coords, options in primitives:
+        moved = [c * sx + dx if i % 2 == 0 else c * sy + dy for i, c in enumerate(coords)]
+        if 'width' in options and stroke_scale != 1:
+            options = dict(options, width=max(1, float(options['width']) * stroke_scale))
+        items.append(getattr(canvas, 'create_' + kind)(*moved, **options))
+    return items
+
+
+_display_lists = {}
+
+
+def template_display_list(name):
+    # Lista de visualización de una plantilla, compilada la primera vez
+    display_list = _display_lists.get(name)
+    if display_list is None:
+        display_list = _display_lists[name] = DisplayList.record(TEMPLATES[name])
+    return display_list
+
+
+# ==============================================
+# Renderizado en memoria (sin pantalla)
+# ==============================================
+
+def _flatten_coords(coords):
+    # create_polygon(points) y create_polygon(x1, y1, x2, y2, ...) valen igual
+    if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+        coords = coords[0]
+    return [float(c) for c in coords]
+
+
+class ImageCanvas:
+    # Superficie PIL con el subconjunto de la API de tk.Canvas que usan las
+    # funciones draw_*. Todo se multiplica por scale, así que el mismo dibujo
+    # de 500x500 se puede exportar a resolución de impresión.
+
+    def __init__(self, width=500, height=500, scale=1, bg='white'):
+        self.scale = scale
+        self.image = Image.new('RGB', (round(width * scale), round(height * scale)), bg)
+        self.draw = ImageDraw.Draw(self.image)
+
+    def _xy(self, coords):
+        flat = _flatten_coords(coords)
+        return [c * self.scale for c in flat]
+
+    def _width(self, width):
+        return max(1, round(float(width) * self.scale))
+
+    def create_line(self, *coords, fill='black', width=1, **options):
+        self.draw.line(self._xy(coords), fill=fill or None, width=self._width(width), joint='curve')
+
+    def create_oval(self, *coords, fill='', outline='black', width=1, **options):
+        self.draw.ellipse(self._xy(coords), fill=fill or None, outline=outline or None,
+                          width=self._width(width))
+
+    def create_rectangle(self, *coords, fill='', outline='black', width=1, **options):
+        self.draw.rectangle(self._xy(coords), fill=fill or None, outline=outline or None,
+                            width=self._width(width))
+
+    def create_polygon(self, *coords, fill='black', outline='', width=1, **options):
+        self.draw.polygon(self._xy(coords), fill=fill or None, outline=outline or None,
+                          width=self._width(width))
+
+    def create_text(self, x, y, text='', font=None, fill='black', **options):
+        size = round((font[1] if font else 12) * self.scale)
+        try:
+            image_font = ImageFont.truetype("arial.ttf", size)
+        except OSError:
+            try:
+                image_font = ImageFont.load_default(size)
+            except TypeError:  # Pillow < 10.1
+                image_font = ImageFont.load_default()
+        self.draw.text((x * self.scale, y * self.scale), text, fill=fill, font=image_font, anchor='mm')
+
+
+def render_template(name, scale=1, size=500, transform=DisplayList.IDENTITY):
+    # Imagen PIL del objeto reconocido; si no hay plantilla, escribe su nombre
+    canvas = ImageCanvas(size, size, scale)
+    if name in TEMPLATES:
+        template_display_list(name).replay(canvas, transform)
+    else:
+        canvas.create_text(size / 2, size / 2, text=name, font=('Arial', 24), fill='blue')
+    return canvas.image
+
+
+def render_primitives(primitives, width, height, scale=1):
+    # Imagen PIL de cualquier lista de primitivas (p. ej. la hoja grande)
+    canvas = ImageCanvas(width, height, scale)
+    replay_primitives(primitives, canvas)
+    return canvas.image
+
+
+def save_png(image, filepath):
+    # Codifica y escribe el PNG; pensado para ejecutarse fuera del hilo de Tk
+    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    image.save(filepath, 'PNG')
+    return filepath
+
+
+# ==============================================
+# Exportación vectorial (SVG y PDF)
+# ==============================================
+
+# Opciones que se leen de cada tipo de elemento del lienzo Tk
+CANVAS_ITEM_OPTIONS = {
+    'line': ('fill', 'width', 'capstyle'),
+    'oval': ('fill', 'outline', 'width'),
+    'rectangle': ('fill', 'outline', 'width'),
+    'polygon': ('fill', 'outline', 'width'),
+    'text': ('text', 'font', 'fill'),
+}
+
+# Valores por defecto de tk.Canvas cuando una primitiva no trae la opción
+_ITEM_DEFAULTS = {
+    'line': {'fill': 'black', 'width': 1},
+    'oval': {'fill': '', 'outline': 'black', 'width': 1},
+    'rectangle': {'fill': '', 'outline': 'black', 'width': 1},
+    'polygon': {'fill': 'black', 'outline': '', 'width': 1},
+    'text': {'fill': 'black', 'text': '', 'font': None},
+}
+
+
+def canvas_primitives(canvas):
+    # Recorre los elementos del lienzo en orden de apilado y los copia como
+    # primitivas (tipo, coordenadas, estilo), igual que las de DisplayList.
+    # Solo hace llamadas baratas a Tk, una por opción y elemento.
+    primitives = []
+    for item in canvas.find_all():
+        kind = canvas.type(item)
+        if kind not in CANVAS_ITEM_OPTIONS:
+            continue
+        options = {name: canvas.itemcget(item, name) for name in CANVAS_ITEM_OPTIONS[kind]}
+        primitives.append((kind, tuple(_flatten_coords(canvas.coords(item))), options))
+    return primitives
+
+
+def _item_style(kind, options):
+    style = dict(_ITEM_DEFAULTS[kind])
+    style.update(options)
+    return style
+
+
+_rgb_cache = {}
+
+
+def _rgb(color):
+    # Color de Tk (nombre o #rrggbb) a RGB; los nombres desconocidos quedan en negro
+    rgb = _rgb_cache.get(color)
+    if rgb is None:
+        try:
+            rgb = ImageColor.getrgb(color)[:3]
+        except ValueError:
+            rgb = (0, 0, 0)
+        _rgb_cache[color] = rgb
+    return rgb
+
+
+def _hex(color):
+    return '#%02x%02x%02x' % _rgb(color)
+
+
+def _font_size(font, default=12):
+    # ('Arial', 24) de las plantillas o "Arial 24" de itemcget
+    if not font:
+        return default
+    parts = font if isinstance(font, (list, tuple)) else str(font).split()
+    for part in reversed(parts):
+        try:
+            return abs(int(part))
+        except (TypeError, ValueError):
+            continue
+    return default
+
+
+def _num(value):
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def _svg_escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def svg_elements(primitives):
+    # Genera un elemento SVG por primitiva, sin acumular el documento
+    for kind, coords, options in primitives:
+        style = _item_style(kind, options)
+        if kind == 'text':
+            x, y = coords[:2]
+            yield (f'<text x="{_num(x)}" y="{_num(y)}" font-size="{_font_size(style["font"])}" '
+                   f'fill="{_hex(style["fill"])}" text-anchor="middle" '
+                   f'dominant-baseline="central">{_svg_escape(str(style["text"]))}</text>\n')
+            continue
+        width = _num(float(style['width']))
+        if kind == 'line':
+            cap = 'round' if style.get('capstyle') == 'round' else 'butt'
+            paint = (f'fill="none" stroke="{_hex(style["fill"])}" stroke-width="{width}" '
+                     f'stroke-linecap="{cap}" stroke-linejoin="round"')
+        else:
+            fill = _hex(style['fill']) if style['fill'] else 'none'
+            paint = f'fill="{fill}"'
+            if style['outline']:
+                paint += f' stroke="{_hex(style["outline"])}" stroke-width="{width}"'
+        if kind == 'oval':
+            x1, y1, x2, y2 = coords
+            yield (f'<ellipse cx="{_num((x1 + x2) / 2)}" cy="{_num((y1 + y2) / 2)}" '
+                   f'rx="{_num(abs(x2 - x1) / 2)}" ry="{_num(abs(y2 - y1) / 2)}" {paint}/>\n')
+        elif kind == 'rectangle':
+            x1, y1, x2, y2 = coords
+            yield (f'<rect x="{_num(min(x1, x2))}" y="{_num(min(y1, y2))}" width="{_num(abs(x2 - x1))}" '
+                   f'height="{_num(abs(y2 - y1))}" {paint}/>\n')
+        else:
+            tag = 'polyline' if kind == 'line' else 'polygon'
+            points = ' '.join(f"{_num(x)},{_num(y)}" for x, y in zip(coords[0::2], coords[1::2]))
+            yield f'<{tag} points="{points}" {paint}/>\n'
+
+
+def write_svg(primitives, filepath, width=500, height=500, bg='white'):
+    # Escribe el SVG elemento a elemento; el coste depende del número de
+    # primitivas, no de la resolución. Pensado para el hilo de E/S.
+    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">\n')
+        if bg:
+            f.write(f'<rect width="100%" height="100%" fill="{_hex(bg)}"/>\n')
+        for element in svg_elements(primitives):
+            f.write(element)
+        f.write('</svg>\n')
+    return filepath
+
+
+# Aproximación de una cuarta parte de elipse con una curva de Bézier
+_KAPPA = 0.5522847498
+
+
+def _pdf_color(color, operator):
+    r, g, b = _rgb(color)
+    return f"{_num(r / 255)} {_num(g / 255)} {_num(b / 255)} {operator}\n"
+
+
+def _pdf_text(text):
+    raw = str(text).encode('cp1252', 'replace').decode('latin-1')
+    return raw.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def pdf_operators(primitives, height=500):
+    # Operadores de dibujo PDF por primitiva; el eje y del PDF crece hacia arriba
+    for kind, coords, options in primitives:
+        style = _item_style(kind, options)
+        ys = [height - y for y in coords[1::2]]
+        xs = list(coords[0::2])
+        if kind == 'text':
+            size = _font_size(style['font'])
+            # Sin métricas de la fuente se centra con el ancho medio de Helvetica
+            x = xs[0] - 0.5 * size * len(str(style['text'])) / 2
+            y = ys[0] - 0.35 * size
+            yield (_pdf_color(style['fill'], 'rg') +
+                   f"BT /F1 {size} Tf {_num(x)} {_num(y)} Td ({_pdf_text(style['text'])}) Tj ET\n")
+            continue
+        ops = [f"{_num(float(style['width']))} w\n"]
+        if kind == 'line':
+            ops.append(_pdf_color(style['fill'], 'RG'))
+            ops.append(f"{1 if style.get('capstyle') == 'round' else 0} J 1 j\n")
+            fill, stroke = False, True
+        else:
+            fill, stroke = bool(style['fill']), bool(style['outline'])
+            if fill:
+                ops.append(_pdf_color(style['fill'], 'rg'))
+            if stroke:
+                ops.append(_pdf_color(style['outline'], 'RG'))
+        if kind == 'oval':
+            cx, cy = (xs[0] + xs[1]) / 2, (ys[0] + ys[1]) / 2
+            rx, ry = abs(xs[1] - xs[0]) / 2, abs(ys[1] - ys[0]) / 2
+            kx, ky = rx * _KAPPA, ry * _KAPPA
+            ops.append(f"{_num(cx + rx)} {_num(cy)} m\n")
+            for (x1, y1, x2, y2, x3, y3) in ((cx + rx, cy + ky, cx + kx, cy + ry, cx, cy + ry),
+                                             (cx - kx, cy + ry, cx - rx, cy + ky, cx - rx, cy),
+                                             (cx - rx, cy - ky, cx - kx, cy - ry, cx, cy - ry),
+                                             (cx + kx, cy - ry, cx + rx, cy - ky, cx + rx, cy)):
+                ops.append(f"{_num(x1)} {_num(y1)} {_num(x2)} {_num(y2)} {_num(x3)} {_num(y3)} c\n")
+            ops.append("h\n")
+        elif kind == 'rectangle':
+            ops.append(f"{_num(min(xs))} {_num(min(ys))} {_num(abs(xs[1] - xs[0]))} "
+                       f"{_num(abs(ys[1] - ys[0]))} re\n")
+        else:
+            ops.append(f"{_num(xs[0])} {_num(ys[0])} m\n")
+            ops.extend(f"{_num(x)} {_num(y)} l\n" for x, y in zip(xs[1:], ys[1:]))
+            if kind == 'polygon':
+                ops.append("h\n")
+        ops.append("B\n" if fill and stroke else "f\n" if fill else "S\n" if stroke else "n\n")
+        yield ''.join(ops)
+
+
+def write_pdf(primitives, filepath, width=500, height=500, bg='white'):
+    # PDF de una página escrito a mano: el contenido se comprime por trozos
+    # mientras se escribe y la longitud del flujo va en un objeto posterior
+    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+    offsets = []
+    with open(filepath, 'wb') as f:
+        def write_object(body):
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        write_object("<< /Type /Catalog /Pages 2 0 R >>")
+        write_object("<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        write_object(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Contents 4 0 R "
+                     f"/Resources << /Font << /F1 6 0 R >> >> >>")
+        offsets.append(f.tell())
+        f.write(b"4 0 obj\n<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n")
+        start = f.tell()
+        import zlib
+        compressor = zlib.compressobj()
+        if bg:
+            f.write(compressor.compress(f"{_pdf_color(bg, 'rg')}0 0 {width} {height} re f\n".encode('latin-1')))
+        for operators in pdf_operators(primitives, height):
+            f.write(compressor.compress(operators.encode('latin-1')))
+        f.write(compressor.flush())
+        length = f.tell() - start
+        f.write(b"\nendstream\nendobj\n")
+        write_object(str(length))
+        write_object("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode('latin-1'))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode('latin-1'))
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+                .encode('latin-1'))
+    return filepath
+
+
+VECTOR_WRITERS = {'.svg': write_svg, '.pdf': write_pdf}
+
+
+def export_vector(primitives, filepath, width=500, height=500):
+    # Elige el formato por la extensión del fichero
+    suffix = Path(filepath).suffix.lower()
+    if suffix not in VECTOR_WRITERS:
+        raise ValueError(f"Formato vectorial no soportado: {suffix}")
+    return VECTOR_WRITERS[suffix](primitives, filepath, width, height)
+
+
+# ==============================================
+# Hoja grande: teselas con zoom y redibujado parcial
+# ==============================================
+
+def primitive_bbox(kind, coords, options):
+    # Caja de una primitiva incluyendo el grosor del trazo (el texto, estimado)
+    xs, ys = coords[0::2], coords[1::2]
+    if kind == 'text':
+        size = _font_size(options.get('font'))
+        half_width = 0.3 * size * len(str(options.get('text', ''))) + size
+        return (xs[0] - half_width, ys[0] - size, xs[0] + half_width, ys[0] + size)
+    pad = float(options.get('width', 1)) / 2 + 1
+    return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class Sheet:
+    # Primitivas en coordenadas del mundo y un índice por celdas fijas, para
+    # que dibujar una tesela solo mire lo que cae cerca de ella
+
+    CELL = 256
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.primitives = []
+        self.bboxes = []
+        self.cells = {}
+
+    def _cells(self, bbox):
+        x1, y1, x2, y2 = (math.floor(c / self.CELL) for c in bbox)
+        return ((cx, cy) for cx in range(x1, x2 + 1) for cy in range(y1, y2 + 1))
+
+    def add(self, primitives):
+        # Devuelve la caja sucia (la unión de las cajas añadidas) o None
+        dirty = None
+        for primitive in primitives:
+            bbox = primitive_bbox(*primitive)
+            index = len(self.primitives)
+            self.primitives.append(primitive)
+            self.bboxes.append(bbox)
+            for cell in self._cells(bbox):
+                self.cells.setdefault(cell, []).append(index)
+            dirty = bbox if dirty is None else (min(dirty[0], bbox[0]), min(dirty[1], bbox[1]),
+                                                max(dirty[2], bbox[2]), max(dirty[3], bbox[3]))
+        return dirty
+
+    def query(self, bbox):
+        # Primitivas que tocan bbox, en el orden en que se añadieron
+        found = set()
+        for cell in self._cells(bbox):
+            found.update(self.cells.get(cell, ()))
+        return [self.primitives[i] for i in sorted(found) if _intersects(self.bboxes[i], bbox)]
+
+
+class SheetView:
+    # Vista con desplazamiento y zoom de una Sheet sobre un tk.Canvas. El
+    # contenido fijo se pinta en teselas PIL que se guardan en caché por
+    # (nivel de zoom, columna, fila); añadir primitivas solo invalida las
+    # teselas que tocan. Cada fotograma pinta hasta agotar frame_budget_ms
+    # y deja el resto para el siguiente, así el bucle de Tk nunca se bloquea
+    # por mucho que haya en la hoja. Los trazos en curso
+    # siguen siendo elementos vectoriales (etiqueta "trazo") encima.
+
+    ZOOM_LEVELS = (0.25, 0.35, 0.5, 0.71, 1.0, 1.41, 2.0, 2.83, 4.0)
+
+    def __init__(self, canvas, sheet=None, width=500, height=500, tile_size=256,
+                 frame_budget_ms=8, frame_interval=16, max_tiles=256):
+        self.canvas = canvas
+        self.sheet = sheet or Sheet()
+        self.width, self.height = width, height
+        self.tile_size = tile_size
+        self.frame_budget = frame_budget_ms / 1000
+        self.frame_interval = frame_interval
+        self.max_tiles = max_tiles
+        self.zoom_index = self.ZOOM_LEVELS.index(1.0)
+        self.origin = (0.0, 0.0)    # punto del mundo en la esquina superior izquierda
+        self.tiles = {}             # (zoom, col, fila) -> PhotoImage o None si está vacía (LRU)
+        self.items = {}             # (col, fila) -> (elemento del lienzo, clave de su tesela)
+        self.stale = {}             # clave -> PhotoImage invalidada que sigue en pantalla
+        self.queue = []
+        self.tiles_rendered = 0
+        self._partial = None        # (clave, ImageCanvas, primitivas, cuántas van) de la tesela en curso
+        self._frame_job = None
+
+    @property
+    def zoom(self):
+        return self.ZOOM_LEVELS[self.zoom_index]
+
+    def to_world(self, x, y):
+        return (self.origin[0] + x / self.zoom, self.origin[1] + y / self.zoom)
+
+    def to_screen(self, x, y):
+        # También vale con arrays de NumPy (una columna de x y otra de y)
+        return ((x - self.origin[0]) * self.zoom, (y - self.origin[1]) * self.zoom)
+
+    def to_world_transform(self):
+        # Transformación (sx, sy, dx, dy) de pantalla a mundo, para replay_primitives
+        return (1 / self.zoom, 1 / self.zoom, self.origin[0], self.origin[1])
+
+    def add(self, primitives):
+        dirty = self.sheet.add(primitives)
+        if dirty:
+            self.invalidate(dirty)
+
+    def clear(self):
+        self.sheet.clear()
+        for item, _ in self.items.values():
+            self.canvas.delete(item)
+        self.items.clear()
+        self.tiles.clear()
+        self.stale.clear()
+        self.queue = []
+        self._partial = None
+
+    def invalidate(self, bbox):
+        # Descarta las teselas (de todos los niveles) que tocan la caja del
+        # mundo. Las que están en pantalla guardan su imagen en stale hasta
+        # que llega la nueva: si Tk pierde la última referencia, la borra.
+        shown = {key for _, key in self.items.values()}
+        for key in [key for key in self.tiles if _intersects(self._tile_bbox(key), bbox)]:
+            photo = self.tiles.pop(key)
+            if photo is not None and key in shown:
+                self.stale[key] = photo
+        if self._partial and _intersects(self._tile_bbox(self._partial[0]), bbox):
+            self._partial = None
+        self.refresh()
+
+    def pan(self, dx, dy):
+        self.origin = (self.origin[0] - dx / self.zoom, self.origin[1] - dy / self.zoom)
+        self.canvas.move("trazo", dx, dy)
+        self.refresh()
+
+    def zoom_at(self, x, y, steps):
+        # Cambia de nivel manteniendo fijo el punto del mundo bajo (x, y)
+        index = min(max(self.zoom_index + steps, 0), len(self.ZOOM_LEVELS) - 1)
+        if index == self.zoom_index:
+            return
+        wx, wy = self.to_world(x, y)
+        factor = self.ZOOM_LEVELS[index] / self.zoom
+        self.zoom_index = index
+        self.origin = (wx - x / self.zoom, wy - y / self.zoom)
+        self.canvas.scale("trazo", x, y, factor, factor)
+        self.refresh()
+
+    def _tile_bbox(self, key):
+        zoom_index, col, row = key
+        size = self.tile_size / self.ZOOM_LEVELS[zoom_index]
+        return (col * size, row * size, (col + 1) * size, (row + 1) * size)
+
+    def visible_tiles(self):
+        size = self.tile_size / self.zoom
+        x1, y1 = self.origin
+        x2, y2 = self.to_world(self.width, self.height)
+        return [(col, row) for row in range(math.floor(y1 / size), math.floor(y2 / size) + 1)
+                for col in range(math.floor(x1 / size), math.floor(x2 / size) + 1)]
+
+    def refresh(self):
+        # Coloca las teselas visibles que ya están en caché y encola las que faltan
+        visible = self.visible_tiles()
+        for tile in [tile for tile in self.items if tile not in visible]:
+            self.canvas.delete(self.items.pop(tile)[0])
+        center = ((self.width / 2 + self.origin[0] * self.zoom) / self.tile_size,
+                  (self.height / 2 + self.origin[1] * self.zoom) / self.tile_size)
+        self.queue = []
+        for col, row in visible:
+            key = (self.zoom_index, col, row)
+            if key in self.tiles:
+                self._show(col, row, key)
+            else:
+                shown = self.items.get((col, row))
+                if shown and shown[1][0] != self.zoom_index:
+                    # Una tesela de otro nivel de zoom quedaría mal escalada
+                    self.canvas.delete(self.items.pop((col, row))[0])
+                elif shown:
+                    # Imagen invalidada: se mueve con la vista hasta que se repinte
+                    self.canvas.coords(shown[0], *self._tile_xy(col, row))
+                self.queue.append(key)
+        displayed = {key for _, key in self.items.values()}
+        self.stale = {key: photo for key, photo in self.stale.items() if key in displayed}
+        # Primero las del centro de la vista
+        self.queue.sort(key=lambda key: -((key[1] + 0.5 - center[0]) ** 2 + (key[2] + 0.5 - center[1]) ** 2))
+        if self.queue and self._frame_job is None:
+            self._frame_job = self.canvas.after(0, self._frame)
+
+    def _tile_xy(self, col, row):
+        return (col * self.tile_size - self.origin[0] * self.zoom,
+                row * self.tile_size - self.origin[1] * self.zoom)
+
+    def _show(self, col, row, key):
+        photo = self.tiles.pop(key)
+        self.tiles[key] = photo  # más reciente al final
+        x, y = self._tile_xy(col, row)
+        shown = self.items.get((col, row))
+        if photo is None:
+            if shown:
+                self.canvas.delete(self.items.pop((col, row))[0])
+            return
+        if shown:
+            item = shown[0]
+            self.canvas.coords(item, x, y)
+            self.canvas.itemconfig(item, image=photo)
+            self.stale.pop(shown[1], None)
+        else:
+            item = self.canvas.create_image(x, y, image=photo, anchor='nw', tags=("tesela",))
+            self.canvas.tag_lower(item)
+        self.items[(col, row)] = (item, key)
+
+    def _frame(self):
+        # Pinta teselas hasta agotar el presupuesto del fotograma. Una tesela
+        # muy cargada se pinta por tandas de primitivas en varios fotogramas.
+        self._frame_job = None
+        deadline = time.perf_counter() + self.frame_budget
+        visible = set(self.visible_tiles())
+        while self.queue and time.perf_counter() < deadline:
+            key = self.queue[-1]
+            if key[0] != self.zoom_index or key[1:] not in visible or key in self.tiles:
+                self.queue.pop()
+                continue
+            if self._partial is None or self._partial[0] != key:
+                self._partial = (key, None, self.sheet.query(self._tile_bbox(key)), 0)
+            if self._render_step(deadline):
+                self.queue.pop()
+                self._show(key[1], key[2], key)
+        while len(self.tiles) > self.max_tiles:
+            del self.tiles[next(iter(self.tiles))]
+        if self.queue:
+            self._frame_job = self.canvas.after(self.frame_interval, self._frame)
+
+    def _render_step(self, deadline, batch=16):
+        # Avanza la tesela a medio pintar; True cuando ya está en self.tiles
+        key, canvas, primitives, done = self._partial
+        if primitives and canvas is None:
+            canvas = ImageCanvas(self.tile_size, self.tile_size)
+        zoom = self.ZOOM_LEVELS[key[0]]
+        transform = (zoom, zoom, -key[1] * self.tile_size, -key[2] * self.tile_size)
+        while done < len(primitives):
+            replay_primitives(primitives[done:done + batch], canvas, transform)
+            done += batch
+            if done < len(primitives) and time.perf_counter() >= deadline:
+                self._partial = (key, canvas, primitives, done)
+                return False
+        self._partial = None
+        self.tiles[key] = ImageTk.PhotoImage(canvas.image) if primitives else None
+        self.tiles_rendered += 1
+        return True
+
+
+# ==============================================
+# Arranque: imágenes en caché y línea de tiempo
+# ==============================================
+
+def cache_dir():
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "drawin"
+
+
+def load_photo(path, max_size=None):
+    # PhotoImage desde una copia PNG ya escalada en la caché. La primera vez
+    # se genera con PIL; después Tk la decodifica directamente y es mucho
+    # más rápido que abrir el PNG grande o el .ico con PIL en cada arranque.
+    source = Path(path)
+    size_tag = "x".join(map(str, max_size)) if max_size else "full"
+    cached = cache_dir() / f"{source.stem}-{size_tag}-{source.stat().st_mtime_ns}.png"
+    if not cached.exists():
+        img = Image.open(source)
+        if max_size:
+            img.thumbnail(max_size)
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            img.save(cached, 'PNG')
+        except OSError:
+            # Caché no escribible (p. ej. quiosco de solo lectura)
+            return ImageTk.PhotoImage(img)
+    return tk.PhotoImage(file=str(cached))
+
+
+class StartupTimeline:
+    # Marcas de tiempo del arranque, en ms desde que empezó a importarse el módulo
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.marks = []
+
+    def mark(self, label):
+        elapsed = (time.perf_counter() - _START_TIME) * 1000
+        self.marks.append((label, elapsed))
+        if self.echo:
+            print(f"[arranque] {elapsed:8.1f} ms  {label}", file=sys.stderr)
+
 
 class SplashScreen:
-    def __init__(self, root, image_path, duration=2000):
+    def __init__(self, root, image_path, duration=None):
         self.root = root
         self.root.overrideredirect(True)  # Remove window decorations
         
@@ -15,37 +1703,40 @@ class SplashScreen:
         screen_width = root.winfo_screenwidth()
         screen_height = root.winfo_screenheight()
         
-        # Load splash image
+        # Load splash image (pre-scaled to half the screen, from the cache)
         try:
-            self.image = Image.open(image_path)
-            img_width, img_height = self.image.size
+            self.tk_image = load_photo(image_path, (screen_width // 2, screen_height // 2))
+            img_width, img_height = self.tk_image.width(), self.tk_image.height()
             x = (screen_width - img_width) // 2
             y = (screen_height - img_height) // 2
             
             self.root.geometry(f"{img_width}x{img_height}+{x}+{y}")
-            self.tk_image = ImageTk.PhotoImage(self.image)
             
             label = tk.Label(root, image=self.tk_image)
             label.pack()
             
-            # Close after duration
-            root.after(duration, root.destroy)
+            # Close after duration (by default it stays until close() is called)
+            if duration:
+                root.after(duration, self.close)
         except Exception as e:
             print(f"Error loading splash image: {e}")
-            root.destroy()
+            self.close()
+            
+    def close(self):
+        if self.root.winfo_exists():
+            self.root.destroy()
 
 class DrawinApp:
-    def __init__(self, root, icon_path=None):
+    def __init__(self, root, icon_path=None, preprocessor=None, metrics=None, recorder=None,
+                 engine="templates", sheet=False):
         self.root = root
+        self.metrics = metrics
+        self.recorder = recorder
         
-        # Configurar icono
+        # Configurar icono cuando la interfaz ya esté construida
+        self.icon_photo = None
         if icon_path and os.path.exists(icon_path):
-            try:
-                img = Image.open(icon_path)
-                photo = ImageTk.PhotoImage(img)
-                root.iconphoto(True, photo)
-            except Exception as e:
-                print(f"Error loading icon: {e}")
+            self.root.after_idle(self.load_icon, icon_path)
         
         self.root.title("Drawin - Dibuja y Transforma")
         self.root.geometry("550x700")
@@ -67,6 +1758,10 @@ class DrawinApp:
                                  command=self.clear_canvas, **button_style)
         self.btn_clear.pack(side=tk.LEFT, padx=5)
         
+        self.btn_undo = tk.Button(self.tool_frame, text="↶ Deshacer", 
+                                command=self.undo_stroke, **button_style)
+        self.btn_undo.pack(side=tk.LEFT, padx=5)
+        
         self.btn_guess = tk.Button(self.tool_frame, text="🔍 Adivinar", 
                                  command=self.guess_drawing, **button_style)
         self.btn_guess.pack(side=tk.LEFT, padx=5)
@@ -81,22 +1776,111 @@ class DrawinApp:
                                 bg='#2196F3', fg='white', relief=tk.FLAT, padx=8, pady=4)
         self.btn_save.pack(side=tk.LEFT, padx=5)
         
+        self.btn_export = tk.Button(self.tool_frame, text="📐 Vectorial", 
+                                  command=self.export_scene, **button_style)
+        self.btn_export.pack(side=tk.LEFT, padx=5)
+        
         # Etiqueta de estado mejorada
         self.status = tk.Label(root, text="Dibuja algo y haz clic en Adivinar", 
                             bg='#f0f0f0', fg='#555555', font=('Arial', 10))
         self.status.pack()
         
+        # Botones con las mejores alternativas del reconocedor por plantillas
+        self.candidate_frame = tk.Frame(root, bg='#f0f0f0')
+        self.candidate_frame.pack()
+        
         # Variables de dibujo
         self.drawing = False
         self.last_x, self.last_y = None, None
-        self.points = []
+        self.sketch = Sketch()
         self.current_guess = None
+        self.features = None
         self.transformed = False
+        self.recognizer = DrawinRecognizer(preprocessor, metrics)
+        self.matcher = RANKING_ENGINES[engine]()
+        self.candidates = []
+        self.accumulator = FeatureAccumulator()
+        self.live_guess_interval = 32  # puntos entre adivinanzas en vivo (0 = desactivado)
+        
+        # Reconocimiento en segundo plano: un hilo trabajador y una cola de
+        # resultados que se vacía desde el bucle de Tk. Cada trazo nuevo,
+        # limpiar o deshacer sube la generación y descarta los trabajos viejos.
+        self.background_recognition = True
+        self.recognition_executor = ThreadPoolExecutor(max_workers=1)
+        self.recognition_results = queue.Queue()
+        self.recognition_generation = 0
+        self._pending_final = None
+        self._pending_speculative = None
+        self._drain_job = None
+        self._after_recognition = None
+        self.recognition_executor.submit(self.matcher.prepare)
+        
+        # Trazo en vivo: una sola polilínea por trazo que se alarga con coords(),
+        # agrupando los eventos de movimiento a la frecuencia de refresco
+        self.polyline_strokes = True
+        self.frame_interval = 16  # ms (~60 fps)
+        self.stroke_item = None
+        self.stroke_coords = []
+        self._flush_job = None
+        
+        # Exportación: escala respecto al lienzo de 500x500 y hilo para escribir ficheros
+        self.export_scale = 4
+        self.template_transform = DisplayList.IDENTITY
+        self.io_executor = ThreadPoolExecutor(max_workers=1)
+        self.vector_formats = ('.svg', '.pdf')
+        # Carpeta de los ficheros guardados (None: no se guarda nada)
+        self.output_dir = Path.home() / "Downloads"
+        # Sin diálogos (reproducciones desatendidas): los avisos van a la
+        # barra de estado y a stderr
+        self.interactive = True
+        
+        # Hoja grande (opcional): los objetos transformados se acumulan en una
+        # hoja con zoom pintada por teselas y el boceto se guarda en
+        # coordenadas del mundo
+        self.sheet_view = SheetView(self.canvas) if sheet else None
+        self._pan_start = None
+        
+        # Transformación animada del trazo a la plantilla (0 = instantánea)
+        self.morph_duration = 400     # ms
+        self.morph_points = 128       # puntos de la polilínea animada
+        self.morph_frame_budget = 4   # ms por fotograma antes de usar menos puntos
+        self._morph = None
+        
+        # Instrumentación: se sustituyen los manejadores por versiones medidas
+        self.metrics_overlay = None
+        if metrics:
+            for name in ("draw", "stop_drawing", "analyze_drawing", "recognize_snapshot",
+                         "transform_drawing", "save_drawing", "export_scene"):
+                setattr(self, name, metrics.wrap(name, getattr(self, name)))
+            self.root.bind("<F2>", self.toggle_metrics_overlay)
+            self.root.after(500, self.sample_metrics)
+        
+        # Grabación de la sesión: igual, se envuelven los manejadores
+        if recorder:
+            for name, event in (("start_drawing", EVENT_PRESS), ("draw", EVENT_MOTION),
+                                ("stop_drawing", EVENT_RELEASE), ("clear_canvas", EVENT_CLEAR),
+                                ("undo_stroke", EVENT_UNDO), ("guess_drawing", EVENT_GUESS),
+                                ("transform_drawing", EVENT_TRANSFORM), ("save_drawing", EVENT_SAVE)):
+                setattr(self, name, recorder.wrap(event, getattr(self, name)))
         
         # Eventos
+        for button, handler in ((self.btn_clear, self.clear_canvas), (self.btn_undo, self.undo_stroke),
+                                (self.btn_guess, self.guess_drawing),
+                                (self.btn_transform, self.transform_drawing),
+                                (self.btn_save, self.save_drawing),
+                                (self.btn_export, self.export_scene)):
+            button.config(command=handler)
         self.canvas.bind("<Button-1>", self.start_drawing)
         self.canvas.bind("<B1-Motion>", self.draw)
         self.canvas.bind("<ButtonRelease-1>", self.stop_drawing)
+        self.root.bind("<Control-z>", self.undo_stroke)
+        if self.sheet_view:
+            for button in (2, 3):
+                self.canvas.bind(f"<Button-{button}>", self.start_pan)
+                self.canvas.bind(f"<B{button}-Motion>", self.pan_sheet)
+            self.canvas.bind("<MouseWheel>", self.zoom_sheet)
+            self.canvas.bind("<Button-4>", self.zoom_sheet)
+            self.canvas.bind("<Button-5>", self.zoom_sheet)
         
         # Objetos reconocibles ampliados (15 objetos)
         self.recognizable_objects = {
@@ -117,176 +1901,329 @@ class DrawinApp:
             "barco": self.draw_boat
         }
         
+    def load_icon(self, icon_path):
+        try:
+            self.icon_photo = load_photo(icon_path, (64, 64))
+            self.root.iconphoto(True, self.icon_photo)
+        except Exception as e:
+            print(f"Error loading icon: {e}")
+            
+    def sample_metrics(self):
+        # Medidores periódicos y refresco de la capa de métricas
+        self.metrics.gauge("canvas_items", len(self.canvas.find_all()))
+        self.metrics.gauge("sketch_points", len(self.sketch))
+        self.metrics.gauge("sketch_strokes", self.sketch.stroke_count)
+        if self.sheet_view:
+            self.metrics.gauge("sheet_primitives", len(self.sheet_view.sheet.primitives))
+            self.metrics.gauge("tiles_rendered", self.sheet_view.tiles_rendered)
+        if self.metrics_overlay is not None:
+            self.metrics_overlay.config(text=self.metrics.summary())
+        self.root.after(500, self.sample_metrics)
+        
+    def toggle_metrics_overlay(self, event=None):
+        if self.metrics_overlay is None:
+            self.metrics_overlay = tk.Label(self.canvas, text=self.metrics.summary(), justify=tk.LEFT,
+                                            bg='#ffffe0', fg='#333333', font=('Courier', 8))
+            self.metrics_overlay.place(x=4, y=4)
+        else:
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+            
+    @property
+    def points(self):
+        # Puntos de todos los trazos del dibujo actual
+        return self.sketch.points()
+        
+    def _sketch_xy(self, event):
+        # Coordenadas del boceto: las del lienzo o, en la hoja grande, las del mundo
+        if self.sheet_view is None:
+            return event.x, event.y
+        x, y = self.sheet_view.to_world(event.x, event.y)
+        return round(x), round(y)
+        
     def start_drawing(self, event):
+        self.finish_morph()
         self.drawing = True
         self.last_x, self.last_y = event.x, event.y
-        self.points = [(event.x, event.y)]
+        if self.transformed:
+            # Dibujar sobre un objeto transformado empieza un dibujo nuevo
+            self.sketch.clear()
+            self.accumulator.reset()
+        self.cancel_recognition()
+        x, y = self._sketch_xy(event)
+        self.sketch.begin_stroke(x, y)
+        self.accumulator.break_stroke()
+        self.accumulator.add(x, y)
         self.current_guess = None
+        self.features = None
+        self.candidates = []
+        self.show_candidates()
         self.transformed = False
         self.status.config(text="Dibujando...")
+        if self.polyline_strokes:
+            self.stroke_coords = [event.x, event.y, event.x, event.y]
+            self.stroke_item = self.canvas.create_line(*self.stroke_coords, width=3, fill='black',
+                                                       capstyle=tk.ROUND, joinstyle=tk.ROUND,
+                                                       tags=("trazo", self._stroke_tag()))
         
     def draw(self, event):
         if self.drawing:
-            self.canvas.create_line(self.last_x, self.last_y, event.x, event.y, 
-                                width=3, fill='black', capstyle=tk.ROUND)
+            if self.polyline_strokes:
+                self.stroke_coords += (event.x, event.y)
+                if self._flush_job is None:
+                    self._flush_job = self.root.after(self.frame_interval, self.flush_stroke)
+            else:
+                self.canvas.create_line(self.last_x, self.last_y, event.x, event.y, 
+                                    width=3, fill='black', capstyle=tk.ROUND,
+                                    tags=("trazo", self._stroke_tag()))
             self.last_x, self.last_y = event.x, event.y
-            self.points.append((event.x, event.y))
+            x, y = self._sketch_xy(event)
+            self.sketch.add_point(x, y)
+            self.accumulator.add(x, y)
+            if self.live_guess_interval and len(self.sketch) % self.live_guess_interval == 0:
+                self.update_live_guess()
+                
+    def update_live_guess(self):
+        # Adivinanza especulativa del trazo a medias; si la anterior aún no ha
+        # terminado no se encola otra, así el hilo nunca se queda atrás
+        if self._pending_speculative is None:
+            self._submit_recognition(final=False)
             
+    def flush_stroke(self):
+        # Vuelca los puntos acumulados desde el último fotograma en la polilínea
+        if self._flush_job is not None:
+            self.root.after_cancel(self._flush_job)
+            self._flush_job = None
+        if self.stroke_item is not None:
+            self.canvas.coords(self.stroke_item, self.stroke_coords)
+            
+    def _stroke_tag(self, index=None):
+        # Etiqueta de los elementos del lienzo de un trazo (para deshacerlo)
+        return f"trazo{self.sketch.stroke_count - 1 if index is None else index}"
+        
     def stop_drawing(self, event):
         if self.drawing:
             self.drawing = False
+            self.flush_stroke()
+            self.stroke_item = None
+            self.stroke_coords = []
             self.analyze_drawing()
             
-    def clear_canvas(self):
-        self.canvas.delete("all")
-        self.points = []
-        self.current_guess = None
-        self.transformed = False
-        self.status.config(text="Lienzo limpio. Dibuja algo nuevo.")
-        
-    def analyze_drawing(self):
-        if len(self.points) < 3:
-            return
-            
-        # Calcular características básicas
-        min_x = min(p[0] for p in self.points)
-        max_x = max(p[0] for p in self.points)
-        min_y = min(p[1] for p in self.points)
-        max_y = max(p[1] for p in self.points)
-        
-        width = max_x - min_x
-        height = max_y - min_y
-        aspect_ratio = width / height if height != 0 else 1
-        
-        # Calcular circularidad
-        centroid_x = sum(p[0] for p in self.points) / len(self.points)
-        centroid_y = sum(p[1] for p in self.points) / len(self.points)
-        distances = [math.sqrt((p[0]-centroid_x)**2 + (p[1]-centroid_y)**2) for p in self.points]
-        avg_distance = sum(distances) / len(distances)
-        circularity = sum(abs(d - avg_distance) for d in distances) / len(distances)
-        
-        # Detección de formas mejorada
-        if circularity < 15 and 0.7 < aspect_ratio < 1.3:
-            self.current_guess = "sol"
-        elif circularity < 20 and aspect_ratio > 1.5:
-            self.current_guess = "coche"
-        elif circularity < 20 and aspect_ratio < 0.7:
-            self.current_guess = "árbol"
-        elif self.is_house_shape():
-            self.current_guess = "casa"
-        elif self.is_star_shape():
-            self.current_guess = "estrella"
-        elif self.is_heart_shape():
-            self.current_guess = "corazón"
-        elif self.is_balloon_shape():
-            self.current_guess = "globo"
-        elif self.is_fish_shape():
-            self.current_guess = "pez"
-            
-    def is_house_shape(self):
-        if len(self.points) < 10:
-            return False
-            
-        angles = self.calculate_angles()
-        right_angles = sum(1 for a in angles if 70 < a < 110)
-        return right_angles >= 2
-        
-    def is_star_shape(self):
-        if len(self.points) < 10:
-            return False
+    def undo_stroke(self, event=None):
+        # Deshace el último trazo del dibujo (no después de transformar)
+        if self.drawing or self.transformed or self._morph is not None or not self.sketch.undo():
+            return
+        self.cancel_recognition()
+        self.canvas.delete(self._stroke_tag(self.sketch.stroke_count))
+        self.accumulator.reset()
+        self.accumulator.add_sketch(self.sketch)
+        self.current_guess = None
+        self.features = None
+        self.candidates = []
+        self.show_candidates()
+        if len(self.sketch):
+            self.analyze_drawing()
+            self.status.config(text="Trazo deshecho")
+        else:
+            self.status.config(text="Dibuja algo y haz clic en Adivinar")
             
-        sharp_turns = 0
-        angles = self.calculate_angles()
-        sharp_turns = sum(1 for a in angles if a < 60)
-        return sharp_turns >= 5
+    def clear_canvas(self):
+        if self._morph is not None:
+            self.root.after_cancel(self._morph.job)
+            self._morph = None
+        if self.sheet_view:
+            self.sheet_view.clear()
+        self.canvas.delete("all")
+        self.stroke_item = None
+        self.stroke_coords = []
+        self.cancel_recognition()
+        self.sketch.clear()
+        self.accumulator.reset()
+        self.current_guess = None
+        self.features = None
+        self.candidates = []
+        self.show_candidates()
+        self.transformed = False
+        self.status.config(text="Lienzo limpio. Dibuja algo nuevo.")
         
-    def is_heart_shape(self):
-        if len(self.points) < 10:
-            return False
+    def analyze_drawing(self):
+        # Se reconoce el dibujo completo, con todos sus trazos
+        if self.background_recognition:
+            self._submit_recognition(final=True)
+        else:
+            self.apply_recognition(self.recognize_snapshot(self.sketch.snapshot(), self.accumulator))
             
-        # Verificar simetría aproximada
-        centroid_x = sum(p[0] for p in self.points) / len(self.points)
-        symmetric_points = 0
-        threshold = 20
-        
-        for x, y in self.points:
-            mirrored_x = 2 * centroid_x - x
-            # Buscar un punto cercano al punto espejo
-            for px, py in self.points:
-                if abs(px - mirrored_x) < threshold and abs(py - y) < threshold:
-                    symmetric_points += 1
-                    break
-                    
-        return symmetric_points / len(self.points) > 0.6
+    def recognize_snapshot(self, snapshot, accumulator):
+        # Se ejecuta en el hilo trabajador: solo usa la copia que recibe y
+        # construye aquí la lista de puntos, fuera del hilo de Tk
+        points = Sketch.snapshot_points(snapshot)
+        guess, features = self.recognizer.analyze(points, accumulator)
+        if features is None:
+            return None, None, []
+        # Las reglas solo cubren 8 objetos; el motor de candidatos ordena los 15
+        return guess, features, self.matcher.recognize(points)
         
-    def is_balloon_shape(self):
-        if len(self.points) < 5:
-            return False
+    def apply_recognition(self, result):
+        guess, features, candidates = result
+        if features is None:
+            return
+        self.features = features
+        self.candidates = candidates
+        if guess:
+            self.current_guess = guess
+        elif self.candidates:
+            self.current_guess = self.candidates[0][0]
             
-        # Verificar si tiene una parte ovalada arriba y una línea abajo
-        upper_points = [p for p in self.points if p[1] < sum(p[1] for p in self.points)/len(self.points)]
-        if len(upper_points) < 3:
-            return False
+    def _submit_recognition(self, final):
+        job = (self.recognition_generation, final)
+        future = self.recognition_executor.submit(self.recognize_snapshot, self.sketch.snapshot(),
+                                                  self.accumulator.copy())
+        future.add_done_callback(lambda f: self.recognition_results.put((job, f)))
+        if final:
+            if self._pending_final is not None:
+                self._pending_final.cancel()
+            self._pending_final = future
+        else:
+            self._pending_speculative = future
+        if self._drain_job is None:
+            self._drain_job = self.root.after(10, self._drain_recognition)
             
-        # Calcular circularidad solo para la parte superior
-        centroid_x = sum(p[0] for p in upper_points) / len(upper_points)
-        centroid_y = sum(p[1] for p in upper_points) / len(upper_points)
-        distances = [math.sqrt((p[0]-centroid_x)**2 + (p[1]-centroid_y)**2) for p in upper_points]
-        avg_distance = sum(distances) / len(distances)
-        circularity = sum(abs(d - avg_distance) for d in distances) / len(distances)
-        
-        return circularity < 25
+    def cancel_recognition(self):
+        # Invalida los trabajos en curso (nuevo trazo, limpiar, deshacer)
+        self.recognition_generation += 1
+        for future in (self._pending_final, self._pending_speculative):
+            if future is not None:
+                future.cancel()
+        self._pending_final = self._pending_speculative = None
+        self._after_recognition = None
         
+    def _drain_recognition(self):
+        # Recoge en el hilo de Tk los resultados que ya terminaron
+        self._drain_job = None
+        while True:
+            try:
+                (generation, final), future = self.recognition_results.get_nowait()
+            except queue.Empty:
+                break
+            if future.cancelled() or generation != self.recognition_generation:
+                continue
+            if future.exception() is not None:
+                print(f"Error en el reconocimiento: {future.exception()}")
+                result = (None, None, [])
+            else:
+                result = future.result()
+            if final:
+                if future is self._pending_final:
+                    self._pending_final = None
+                self.apply_recognition(result)
+                action, self._after_recognition = self._after_recognition, None
+                if action:
+                    action()
+            else:
+                if future is self._pending_speculative:
+                    self._pending_speculative = None
+                guess = result[0] or (result[2][0][0] if result[2] else None)
+                if self.drawing and guess:
+                    self.status.config(text=f"Dibujando... parece un {guess}")
+        if self._pending_final is not None or self._pending_speculative is not None:
+            self._drain_job = self.root.after(10, self._drain_recognition)
+
+    # Envoltorios de compatibilidad sobre el motor de reconocimiento
+    def is_house_shape(self):
+        return self.recognizer.is_house_shape(self.points)
+
+    def is_star_shape(self):
+        return self.recognizer.is_star_shape(self.points)
+
+    def is_heart_shape(self):
+        return self.recognizer.is_heart_shape(self.points)
+
+    def is_balloon_shape(self):
+        return self.recognizer.is_balloon_shape(self.points)
+
     def is_fish_shape(self):
-        if len(self.points) < 10:
-            return False
-            
-        # Verificar si tiene una cola (punto donde cambia bruscamente la dirección)
-        angles = self.calculate_angles()
-        sharp_turns = sum(1 for a in angles if a < 45)
-        return 1 <= sharp_turns <= 3
-        
+        return self.recognizer.is_fish_shape(self.points)
+
     def calculate_angles(self):
-        angles = []
-        for i in range(1, len(self.points)-1):
-            x1, y1 = self.points[i-1]
-            x2, y2 = self.points[i]
-            x3, y3 = self.points[i+1]
+        return self.recognizer.calculate_angles(self.points)
+
+    def notify(self, message, error=False):
+        if self.interactive:
+            (messagebox.showerror if error else messagebox.showinfo)("Drawin", message)
+        else:
+            self.status.config(text=message.replace("\n", " "))
+            print(f"Drawin: {message}", file=sys.stderr)
             
-            angle = math.degrees(math.atan2(y3-y2, x3-x2) - math.atan2(y1-y2, x1-x2))
-            angle = abs(angle)
-            if angle > 180:
-                angle = 360 - angle
-            angles.append(angle)
-        return angles
-        
     def guess_drawing(self):
-        if not self.points:
-            messagebox.showinfo("Drawin", "¡Dibuja algo primero!")
+        if not len(self.sketch):
+            self.notify("¡Dibuja algo primero!")
+            return
+        if self._pending_final is not None:
+            # Contestar en cuanto termine el reconocimiento en curso
+            # Sin pasar por los envoltorios: no es una nueva pulsación del botón
+            self._after_recognition = lambda: DrawinApp.guess_drawing(self)
+            self.status.config(text="Analizando el dibujo...")
             return
             
         if self.current_guess:
             self.status.config(text=f"Creo que es un {self.current_guess}. ¡Haz clic en Transformar!")
+            self.show_candidates()
         else:
             options = list(self.recognizable_objects.keys())
-            user_guess = simpledialog.askstring("Drawin", 
-                                            "No estoy seguro. ¿Qué estabas dibujando?\nOpciones: " + ", ".join(options),
-                                            parent=self.root)
+            user_guess = None
+            if self.interactive:
+                user_guess = simpledialog.askstring("Drawin", 
+                                                "No estoy seguro. ¿Qué estabas dibujando?\nOpciones: " + ", ".join(options),
+                                                parent=self.root)
             if user_guess and user_guess.lower() in self.recognizable_objects:
                 self.current_guess = user_guess.lower()
                 self.status.config(text=f"¡Transformaré tu dibujo en un {self.current_guess}!")
             else:
                 self.status.config(text="No reconozco ese objeto. Intenta con otro dibujo.")
                 
+    def show_candidates(self):
+        for button in self.candidate_frame.winfo_children():
+            button.destroy()
+        for name, score in self.candidates:
+            tk.Button(self.candidate_frame, text=f"{name} ({score:.0%})", bg='#ffffff', relief=tk.FLAT,
+                      command=lambda name=name: self.choose_candidate(name)).pack(side=tk.LEFT, padx=3)
+            
+    def choose_candidate(self, name):
+        self.current_guess = name
+        self.status.config(text=f"¡Transformaré tu dibujo en un {name}!")
+        
     def transform_drawing(self):
+        if self._pending_final is not None:
+            self._after_recognition = lambda: DrawinApp.transform_drawing(self)
+            self.status.config(text="Analizando el dibujo...")
+            return
         if not self.current_guess:
-            messagebox.showinfo("Drawin", "Primero adivina o especifica qué es tu dibujo.")
+            self.notify("Primero adivina o especifica qué es tu dibujo.")
             return
+        self.finish_morph()
+        # Un boceto ya transformado no se vuelve a animar (ni a añadir a la hoja)
+        if (self.morph_duration and not self.transformed and self.features and len(self.sketch) > 1
+                and self.current_guess in self.recognizable_objects):
+            self.start_morph()
+        else:
+            self.finish_transform()
             
+    def finish_transform(self):
+        # Pinta el objeto elegido en su sitio definitivo
+        if self.sheet_view:
+            self.place_on_sheet()
+            return
         self.canvas.delete("all")
-        draw_function = self.recognizable_objects.get(self.current_guess)
-        if draw_function:
-            draw_function()
+        self.stroke_item = None
+        if self.current_guess in self.recognizable_objects:
+            # Reproducir la plantilla compilada ajustada a la caja del trazo
+            display_list = template_display_list(self.current_guess)
+            if self.features:
+                f = self.features
+                self.template_transform = display_list.fit((f["min_x"], f["min_y"], f["max_x"], f["max_y"]))
+            else:
+                self.template_transform = DisplayList.IDENTITY
+            display_list.replay(self.canvas, self.template_transform)
             self.transformed = True
             self.status.config(text=f"¡Voilà! Tu dibujo ahora es un {self.current_guess}. Puedes guardarlo.")
         else:
@@ -294,213 +2231,1310 @@ class DrawinApp:
                                 font=('Arial', 24), fill='blue')
             self.transformed = True
             
+    def _morph_source(self):
+        # Cada trazo se remuestrea por separado, con puntos en proporción a su
+        # longitud (al menos 2): (puntos, [(inicio, fin) de cada trazo])
+        xy = self.sketch.as_array().astype(np.float64)
+        strokes = np.split(xy, self.sketch.starts[1:])
+        lengths = np.array([np.hypot(*np.diff(stroke, axis=0).T).sum() for stroke in strokes])
+        total = lengths.sum()
+        shares = lengths / total if total else np.full(len(strokes), 1 / len(strokes))
+        counts = np.maximum(2, np.rint(shares * self.morph_points)).astype(int)
+        ends = np.cumsum(counts)
+        source = np.concatenate([_resample_xy(stroke, n) for stroke, n in zip(strokes, counts)])
+        return source, list(zip((ends - counts).tolist(), ends.tolist()))
+        
+    def start_morph(self):
+        # Transición animada: los trazos remuestreados se deforman hasta el
+        # contorno de la plantilla ajustada a su caja, con una polilínea por
+        # trazo para no dibujar los saltos entre un trazo y el siguiente
+        f = self.features
+        display_list = template_display_list(self.current_guess)
+        transform = display_list.fit((f["min_x"], f["min_y"], f["max_x"], f["max_y"]))
+        source, spans = self._morph_source()
+        outline = np.asarray(display_list.outline(), dtype=np.float64) * transform[:2] + transform[2:]
+        target = _resample_xy(outline, len(source))
+        
+        # Punto de inicio y sentido del contorno más parecidos al trazo, para
+        # que cada punto recorra el camino más corto
+        candidates = [np.roll(variant, -shift, axis=0) for variant in (target, target[::-1])
+                      for shift in range(0, len(source), 4)]
+        costs = [np.square(candidate - source).sum() for candidate in candidates]
+        target = candidates[int(np.argmin(costs))]
+        
+        self.canvas.delete("trazo" if self.sheet_view else "all")
+        self.stroke_item = None
+        items = [self.canvas.create_line(*self._morph_coords(source[start:end]), width=3, fill='black',
+                                         capstyle=tk.ROUND, joinstyle=tk.ROUND, tags=("morph",))
+                 for start, end in spans]
+        self._morph = SimpleNamespace(items=items, spans=spans, source=source, delta=target - source,
+                                      start=time.perf_counter(), step=1, dropped=0, job=None)
+        self.status.config(text=f"Transformando en {self.current_guess}...")
+        self._morph.job = self.root.after(self.frame_interval, self._morph_frame)
+        
+    def _morph_frame(self):
+        # Un fotograma: la posición depende del reloj, no del número de
+        # fotogramas, así que si Tk se retrasa se saltan fotogramas en vez de
+        # alargar la animación. Si actualizar la línea pasa del presupuesto,
+        # se usa un punto de cada dos en los siguientes.
+        morph = self._morph
+        frame_start = time.perf_counter()
+        t = (frame_start - morph.start) * 1000 / self.morph_duration
+        if t >= 1:
+            self.finish_morph()
+            return
+        eased = t * t * (3 - 2 * t)
+        points = morph.source + morph.delta * eased
+        for item, (start, end) in zip(morph.items, morph.spans):
+            # Un punto de cada step, sin perder el último de cada trazo
+            self.canvas.coords(item, self._morph_coords(np.concatenate(
+                (points[start:end - 1:morph.step], points[end - 1:end]))))
+        elapsed = (time.perf_counter() - frame_start) * 1000
+        if elapsed > self.morph_frame_budget and morph.step < self.morph_points // 16:
+            morph.step *= 2
+            morph.dropped += 1
+        morph.job = self.root.after(max(1, round(self.frame_interval - elapsed)), self._morph_frame)
+        
+    def _morph_coords(self, points):
+        # Los puntos del morph están en coordenadas del boceto; en la hoja
+        # grande se pasan a pantalla en cada fotograma, así siguen al zoom
+        if self.sheet_view:
+            points = np.column_stack(self.sheet_view.to_screen(points[:, 0], points[:, 1]))
+        return points.ravel().tolist()
+        
+    def finish_morph(self):
+        # Termina la animación en curso (si la hay) y pinta el objeto final
+        morph, self._morph = self._morph, None
+        if morph is None:
+            return
+        if morph.job is not None:
+            self.root.after_cancel(morph.job)
+        self.canvas.delete("morph")
+        self.finish_transform()
+        
+    def place_on_sheet(self):
+        # En la hoja grande el objeto sustituye al boceto y se queda en la
+        # hoja junto a los anteriores; solo se repintan las teselas que toca
+        if self.transformed:
+            # Este boceto ya está en la hoja: no se añade dos veces
+            self.status.config(text=f"Tu {self.current_guess} ya está en la hoja. Dibuja algo nuevo.")
+            return
+        self.canvas.delete("trazo")
+        self.stroke_item = None
+        if self.features:
+            f = self.features
+            bbox = (f["min_x"], f["min_y"], f["max_x"], f["max_y"])
+        else:
+            cx, cy = self.sheet_view.to_world(250, 250)
+            bbox = (cx - 150, cy - 150, cx + 150, cy + 150)
+        recorder = RecordingCanvas()
+        if self.current_guess in self.recognizable_objects:
+            display_list = template_display_list(self.current_guess)
+            display_list.replay(recorder, display_list.fit(bbox))
+        else:
+            recorder.create_text((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2,
+                                 text=self.current_guess, font=('Arial', 24), fill='blue')
+        self.sheet_view.add(recorder.primitives)
+        self.template_transform = DisplayList.IDENTITY
+        self.transformed = True
+        self.status.config(text=f"¡Voilà! Tu dibujo ahora es un {self.current_guess}. Puedes guardarlo.")
+        
+    def sheet_primitives(self, extra=(), margin=20):
+        # (primitivas, ancho, alto) de la hoja más extra, movidas para que su
+        # contenido empiece en (margin, margin)
+        primitives = self.sheet_view.sheet.primitives + list(extra)
+        if not primitives:
+            return [], 0, 0
+        bboxes = [primitive_bbox(*primitive) for primitive in primitives]
+        x1, y1 = min(b[0] for b in bboxes) - margin, min(b[1] for b in bboxes) - margin
+        width = math.ceil(max(b[2] for b in bboxes) + margin - x1)
+        height = math.ceil(max(b[3] for b in bboxes) + margin - y1)
+        recorder = RecordingCanvas()
+        replay_primitives(primitives, recorder, (1, 1, -x1, -y1))
+        return recorder.primitives, width, height
+        
+    def start_pan(self, event):
+        self._pan_start = (event.x, event.y)
+        
+    def pan_sheet(self, event):
+        if self._pan_start is None:
+            return
+        self.sheet_view.pan(event.x - self._pan_start[0], event.y - self._pan_start[1])
+        self._pan_start = (event.x, event.y)
+        
+    def zoom_sheet(self, event):
+        # Rueda del ratón: event.delta en Windows/macOS, botones 4 y 5 en X11
+        steps = 1 if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0 else -1
+        self.sheet_view.zoom_at(event.x, event.y, steps)
+            
     def save_drawing(self):
+        # Si la animación sigue en marcha se termina: se guarda el resultado final
+        self.finish_morph()
         if not self.transformed:
-            messagebox.showinfo("Drawin", "Primero transforma tu dibujo para guardarlo.")
+            self.notify("Primero transforma tu dibujo para guardarlo.")
+            return
+        if self.output_dir is None:
+            self.status.config(text="Guardado omitido")
             return
         
-        # Obtener la carpeta de Descargas del usuario
-        downloads_path = str(Path.home() / "Downloads")
         timestamp = time.strftime("%Y%m%d-%H%M%S")
         filename = f"Drawin_{self.current_guess}_{timestamp}.png"
-        filepath = os.path.join(downloads_path, filename)
-    
-        # Crear una imagen PIL del canvas
-        x = self.root.winfo_rootx() + self.canvas.winfo_x()
-        y = self.root.winfo_rooty() + self.canvas.winfo_y()
-        width = self.canvas.winfo_width()
-        height = self.canvas.winfo_height()
+        filepath = os.path.join(self.output_dir, filename)
     
-        # Capturar la pantalla del canvas
-        img = ImageGrab.grab(bbox=(x, y, x + width, y + height))
-        img.save(filepath, 'PNG')
+        # Renderizar la plantilla en memoria y codificar el PNG en segundo plano,
+        # sin capturar la pantalla ni bloquear la interfaz
+        guess, scale, transform = self.current_guess, self.export_scale, self.template_transform
+        encode = save_png if self.metrics is None else self.metrics.wrap("save_encode", save_png)
+        if self.sheet_view:
+            # En la hoja grande se guarda la hoja entera, no solo el último objeto
+            primitives, width, height = self.sheet_primitives()
+            scale = min(scale, 8000 / max(width, height, 1))  # acotar el tamaño del PNG
+            render = lambda: render_primitives(primitives, width, height, scale)
+        else:
+            render = lambda: render_template(guess, scale, transform=transform)
+        future = self.io_executor.submit(lambda: encode(render(), filepath))
+        self.status.config(text=f"Guardando {filename}...")
+        self._wait_for_save(future, filename)
+        
+    def _wait_for_save(self, future, filename):
+        if not future.done():
+            self.root.after(50, self._wait_for_save, future, filename)
+            return
+        try:
+            filepath = future.result()
+        except Exception as e:
+            self.status.config(text="No se pudo guardar el dibujo")
+            self.notify(f"Error al guardar el dibujo:\n{e}", error=True)
+            return
+        folder = "Descargas" if Path(self.output_dir) == Path.home() / "Downloads" else self.output_dir
+        self.status.config(text=f"Dibujo guardado como {filename} en {folder}")
+        self.notify(f"¡Dibujo guardado con éxito!\n{filepath}")
     
-        self.status.config(text=f"Dibujo guardado como {filename} en Descargas")
-        messagebox.showinfo("Drawin", f"¡Dibujo guardado con éxito!\n{filepath}")
+    def export_scene(self):
+        # Copia los elementos del lienzo (plantilla o trazos del usuario) en el
+        # hilo de Tk y escribe SVG/PDF en segundo plano, sin rasterizar. Si la
+        # animación sigue en marcha se termina: se exporta el objeto final
+        self.finish_morph()
+        self.flush_stroke()
+        primitives = canvas_primitives(self.canvas)
+        width, height = int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+        if self.sheet_view:
+            # La hoja entera (más el boceto pasado al mundo), recortada a su contenido
+            recorder = RecordingCanvas()
+            replay_primitives(primitives, recorder, self.sheet_view.to_world_transform())
+            primitives, width, height = self.sheet_primitives(recorder.primitives)
+        if not primitives:
+            self.notify("No hay nada que exportar. Dibuja algo primero.")
+            return
+        if self.output_dir is None:
+            self.status.config(text="Exportación omitida")
+            return
+        
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        name = self.current_guess if self.transformed else "boceto"
+        filenames = [f"Drawin_{name}_{timestamp}{suffix}" for suffix in self.vector_formats]
+        encode = export_vector if self.metrics is None else self.metrics.wrap("vector_encode", export_vector)
+        
+        def write_all():
+            paths = [encode(primitives, os.path.join(self.output_dir, filename), width, height)
+                     for filename in filenames]
+            return "\n".join(paths)
+        
+        future = self.io_executor.submit(write_all)
+        filename = ", ".join(filenames)
+        self.status.config(text=f"Guardando {filename}...")
+        self._wait_for_save(future, filename)
     
     # ==============================================
     # Funciones de dibujo para todos los objetos
     # ==============================================
     
-    def draw_sun(self):
-        self.canvas.create_oval(150, 150, 350, 350, fill='yellow', outline='orange', width=2)
-        for i in range(0, 360, 30):
-            rad = math.radians(i)
-            x1 = 250 + 110 * math.cos(rad)
-            y1 = 250 + 110 * math.sin(rad)
-            x2 = 250 + 140 * math.cos(rad)
-            y2 = 250 + 140 * math.sin(rad)
-            self.canvas.create_line(x1, y1, x2, y2, width=3, fill='orange')
-        
-    def draw_moon(self):
-        self.canvas.create_oval(175, 150, 325, 300, fill='#f0f0f0', outline='gray', width=2)
-        self.canvas.create_oval(200, 150, 300, 300, fill='white', outline='white')
-        
-    def draw_house(self):
-        # Base de la casa
-        self.canvas.create_rectangle(175, 250, 325, 350, fill='#FFD700', outline='brown', width=2)
-        # Techo
-        self.canvas.create_polygon(160, 250, 340, 250, 250, 170, fill='red', outline='brown', width=2)
-        # Puerta
-        self.canvas.create_rectangle(230, 280, 270, 350, fill='brown', outline='black', width=1)
-        # Ventanas
-        self.canvas.create_rectangle(190, 270, 220, 300, fill='#87CEEB', outline='black', width=1)
-        self.canvas.create_rectangle(280, 270, 310, 300, fill='#87CEEB', outline='black', width=1)
-        
-    def draw_tree(self):
-        # Tronco
-        self.canvas.create_rectangle(235, 300, 265, 350, fill='brown', outline='black', width=1)
-        # Copa
-        self.canvas.create_oval(150, 200, 350, 300, fill='green', outline='darkgreen', width=2)
-        
-    def draw_car(self):
-        # Cuerpo
-        self.canvas.create_rectangle(150, 250, 350, 280, fill='red', outline='black', width=2)
-        self.canvas.create_rectangle(180, 230, 320, 250, fill='red', outline='black', width=2)
-        # Ruedas
-        self.canvas.create_oval(160, 270, 190, 300, fill='black')
-        self.canvas.create_oval(310, 270, 340, 300, fill='black')
-        
-    def draw_person(self):
-        # Cabeza
-        self.canvas.create_oval(225, 150, 275, 200, fill='#FFD699', outline='black', width=1)
-        # Cuerpo
-        self.canvas.create_line(250, 200, 250, 275, width=2)
-        # Brazos
-        self.canvas.create_line(250, 225, 190, 240, width=2)
-        self.canvas.create_line(250, 225, 310, 240, width=2)
-        # Piernas
-        self.canvas.create_line(250, 275, 220, 320, width=2)
-        self.canvas.create_line(250, 275, 280, 320, width=2)
-        
-    def draw_cat(self):
-        # Cabeza
-        self.canvas.create_oval(200, 180, 300, 280, fill='gray', outline='black', width=1)
-        # Orejas
-        self.canvas.create_polygon(210, 180, 230, 140, 250, 180, fill='gray', outline='black', width=1)
-        self.canvas.create_polygon(250, 180, 270, 140, 290, 180, fill='gray', outline='black', width=1)
-        # Ojos
-        self.canvas.create_oval(225, 210, 235, 220, fill='green', outline='black', width=1)
-        self.canvas.create_oval(265, 210, 275, 220, fill='green', outline='black', width=1)
-        # Nariz y boca
-        self.canvas.create_polygon(245, 230, 255, 230, 250, 240, fill='pink', outline='black', width=1)
-        self.canvas.create_line(250, 240, 250, 250, width=1)
-        self.canvas.create_line(250, 250, 230, 260, width=1)
-        self.canvas.create_line(250, 250, 270, 260, width=1)
-        
-    def draw_dog(self):
-        # Cabeza
-        self.canvas.create_oval(200, 180, 300, 280, fill='#8B4513', outline='black', width=1)
-        # Orejas
-        self.canvas.create_oval(200, 180, 240, 220, fill='#8B4513', outline='black', width=1)
-        self.canvas.create_oval(260, 180, 300, 220, fill='#8B4513', outline='black', width=1)
-        # Ojos
-        self.canvas.create_oval(225, 210, 235, 220, fill='black')
-        self.canvas.create_oval(265, 210, 275, 220, fill='black')
-        # Nariz
-        self.canvas.create_oval(245, 230, 255, 240, fill='black')
-        # Boca
-        self.canvas.create_line(250, 240, 250, 250, width=1)
-        self.canvas.create_line(250, 250, 230, 255, width=1)
-        self.canvas.create_line(250, 250, 270, 255, width=1)
-        
-    def draw_flower(self):
-        # Tallo
-        self.canvas.create_line(250, 250, 250, 350, fill='green', width=3)
-        # Hojas
-        self.canvas.create_oval(200, 270, 230, 300, fill='green', outline='darkgreen', width=1)
-        self.canvas.create_oval(270, 300, 300, 330, fill='green', outline='darkgreen', width=1)
-        # Flor
-        self.canvas.create_oval(200, 200, 300, 300, fill='yellow', outline='orange', width=2)
-        for i in range(0, 360, 45):
-            rad = math.radians(i)
-            x1 = 250 + 50 * math.cos(rad)
-            y1 = 250 + 50 * math.sin(rad)
-            x2 = 250 + 80 * math.cos(rad)
-            y2 = 250 + 80 * math.sin(rad)
-            self.canvas.create_line(x1, y1, x2, y2, width=3, fill='pink')
-            
-    def draw_star(self):
-        points = []
-        for i in range(5):
-            # Puntos externos
-            angle = math.radians(90 + i * 72)
-            x = 250 + 80 * math.cos(angle)
-            y = 250 + 80 * math.sin(angle)
-            points.extend([x, y])
-            
-            # Puntos internos
-            angle = math.radians(90 + 36 + i * 72)
-            x = 250 + 30 * math.cos(angle)
-            y = 250 + 30 * math.sin(angle)
-            points.extend([x, y])
-            
-        self.canvas.create_polygon(points, fill='yellow', outline='gold', width=2)
+    def draw_sun(self, canvas=None):
+        draw_sun(self.canvas if canvas is None else canvas)
         
-    def draw_heart(self):
-        points = []
-        for t in range(0, 628, 10):  # 0 a 2π en pasos de 0.1 radianes
-            t = t / 100
-            x = 250 + 16 * math.sin(t)**3
-            y = 250 - (13 * math.cos(t) - 5 * math.cos(2*t) - 2 * math.cos(3*t) - math.cos(4*t))
-            points.extend([x, y])
-        
-        self.canvas.create_polygon(points, fill='red', outline='darkred', width=2)
-        
-    def draw_balloon(self):
-        # Globo
-        self.canvas.create_oval(200, 150, 300, 250, fill='red', outline='darkred', width=2)
-        # Cuerda
-        self.canvas.create_line(250, 250, 250, 300, fill='gray', width=1)
-        # Canasta
-        self.canvas.create_rectangle(230, 300, 270, 310, fill='brown', outline='black', width=1)
-        
-    def draw_fish(self):
-        # Cuerpo
-        self.canvas.create_oval(200, 200, 300, 250, fill='orange', outline='black', width=1)
-        # Cola
-        self.canvas.create_polygon(300, 225, 330, 200, 330, 250, fill='orange', outline='black', width=1)
-        # Ojo
-        self.canvas.create_oval(210, 215, 220, 225, fill='black')
-        # Aletas
-        self.canvas.create_polygon(230, 225, 250, 210, 270, 225, fill='orange', outline='black', width=1)
-        self.canvas.create_polygon(230, 225, 250, 240, 270, 225, fill='orange', outline='black', width=1)
-        
-    def draw_butterfly(self):
-        # Cuerpo
-        self.canvas.create_line(250, 200, 250, 300, fill='black', width=3)
-        # Alas superiores
-        self.canvas.create_oval(150, 150, 250, 250, fill='purple', outline='black', width=1)
-        self.canvas.create_oval(250, 150, 350, 250, fill='purple', outline='black', width=1)
-        # Alas inferiores
-        self.canvas.create_oval(170, 220, 250, 300, fill='blue', outline='black', width=1)
-        self.canvas.create_oval(250, 220, 330, 300, fill='blue', outline='black', width=1)
-        # Antenas
-        self.canvas.create_line(250, 200, 230, 170, fill='black', width=1)
-        self.canvas.create_line(250, 200, 270, 170, fill='black', width=1)
-        
-    def draw_boat(self):
-        # Casco
-        self.canvas.create_polygon(200, 300, 300, 300, 280, 270, 220, 270, fill='brown', outline='black', width=2)
-        # Vela
-        self.canvas.create_polygon(250, 270, 250, 200, 300, 270, fill='white', outline='black', width=1)
-        # Mástil
-        self.canvas.create_line(250, 270, 250, 180, fill='brown', width=3)
-        # Bandera
-        self.canvas.create_rectangle(250, 180, 270, 190, fill='red', outline='black', width=1)
+    def draw_moon(self, canvas=None):
+        draw_moon(self.canvas if canvas is None else canvas)
+        
+    def draw_house(self, canvas=None):
+        draw_house(self.canvas if canvas is None else canvas)
+        
+    def draw_tree(self, canvas=None):
+        draw_tree(self.canvas if canvas is None else canvas)
+        
+    def draw_car(self, canvas=None):
+        draw_car(self.canvas if canvas is None else canvas)
+        
+    def draw_person(self, canvas=None):
+        draw_person(self.canvas if canvas is None else canvas)
+        
+    def draw_cat(self, canvas=None):
+        draw_cat(self.canvas if canvas is None else canvas)
+        
+    def draw_dog(self, canvas=None):
+        draw_dog(self.canvas if canvas is None else canvas)
+        
+    def draw_flower(self, canvas=None):
+        draw_flower(self.canvas if canvas is None else canvas)
+        
+    def draw_star(self, canvas=None):
+        draw_star(self.canvas if canvas is None else canvas)
+        
+    def draw_heart(self, canvas=None):
+        draw_heart(self.canvas if canvas is None else canvas)
+        
+    def draw_balloon(self, canvas=None):
+        draw_balloon(self.canvas if canvas is None else canvas)
+        
+    def draw_fish(self, canvas=None):
+        draw_fish(self.canvas if canvas is None else canvas)
+        
+    def draw_butterfly(self, canvas=None):
+        draw_butterfly(self.canvas if canvas is None else canvas)
+        
+    def draw_boat(self, canvas=None):
+        draw_boat(self.canvas if canvas is None else canvas)
 
-# Configuración inicial
-if __name__ == "__main__":
+# ==============================================
+# Trazos sintéticos y banco de pruebas
+# ==============================================
+
+def synthesize_stroke(name, n_points=64, noise=2.0, rng=None):
+    # Trazo sintético de un objeto: el contorno de su plantilla remuestreado
+    # a n_points, con escala, giro y posición aleatorios y temblor gaussiano.
+    # Se redondea a enteros como los eventos del ratón.
+    rng = rng or random.Random()
+    display_list = template_display_list(name)
+    points = resample_stroke(display_list.outline(), n_points)
+    x1, y1, x2, y2 = display_list.bbox
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    scale = rng.uniform(0.7, 1.3)
+    angle = math.radians(rng.uniform(-10, 10))
+    dx, dy = rng.uniform(-40, 40), rng.uniform(-40, 40)
+    cos_a, sin_a = math.cos(angle) * scale, math.sin(angle) * scale
+    stroke = []
+    for x, y in points:
+        x, y = x - cx, y - cy
+        stroke.append((round(cx + dx + x * cos_a - y * sin_a + rng.gauss(0, noise)),
+                       round(cy + dy + x * sin_a + y * cos_a + rng.gauss(0, noise))))
+    return stroke
+
+
+def _latency_summary(samples_ns):
+    samples = sorted(samples_ns)
+    return {
+        "n": len(samples),
+        "mean_us": sum(samples) / len(samples) / 1000,
+        "median_us": samples[len(samples) // 2] / 1000,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] / 1000,
+        "max_us": samples[-1] / 1000,
+    }
+
+
+def run_benchmark(lengths=(32, 128, 512, 2048), samples=10, noise=2.0, seed=0, recognizer=None):
+    # Latencia de cada detector según la longitud del trazo y precisión de
+    # cada motor sobre trazos sintéticos de todos los objetos reconocibles
+    recognizer = recognizer or DrawinRecognizer()
+    matcher = TemplateRecognizer()
+    matcher.prepare()
+    bitmaps = BitmapRecognizer()
+    bitmaps.prepare()
+    rng = random.Random(seed)
+    detectors = {
+        "analyze": lambda pts: recognizer.analyze(pts),
+        "features": recognizer.features,
+        "calculate_angles": recognizer.calculate_angles,
+        "is_house_shape": recognizer.is_house_shape,
+        "is_star_shape": recognizer.is_star_shape,
+        "is_heart_shape": recognizer.is_heart_shape,
+        "is_balloon_shape": recognizer.is_balloon_shape,
+        "is_fish_shape": recognizer.is_fish_shape,
+        "template_match": matcher.recognize,
+        "bitmap_match": bitmaps.recognize,
+    }
+    # Motor -> (detector medido, función que extrae la adivinanza de su resultado)
+    engines = {
+        "rules": ("analyze", lambda result: result[0]),
+        "templates": ("template_match", lambda result: result[0][0] if result else None),
+        "bitmap": ("bitmap_match", lambda result: result[0][0] if result else None),
+    }
+    timings = {name: {} for name in detectors}
+    confusion = {engine: {name: {} for name in TEMPLATES} for engine in engines}
+    clock = time.perf_counter_ns
+
+    for length in lengths:
+        per_detector = {name: [] for name in detectors}
+        for true_name in TEMPLATES:
+            for _ in range(samples):
+                stroke = synthesize_stroke(true_name, length, noise, rng)
+                results = {}
+                for name, detector in detectors.items():
+                    start = clock()
+                    results[name] = detector(stroke)
+                    per_detector[name].append(clock() - start)
+                for engine, (name, extract) in engines.items():
+                    guess = extract(results[name]) or "ninguno"
+                    row = confusion[engine][true_name]
+                    row[guess] = row.get(guess, 0) + 1
+        for name, values in per_detector.items():
+            timings[name][str(length)] = _latency_summary(values)
+
+    def accuracy(matrix):
+        total = sum(sum(row.values()) for row in matrix.values())
+        correct = sum(row.get(name, 0) for name, row in matrix.items())
+        return {
+            "accuracy": correct / total if total else 0.0,
+            "per_class_accuracy": {name: row.get(name, 0) / max(1, sum(row.values()))
+                                   for name, row in matrix.items()},
+            "confusion": matrix,
+        }
+
+    report = {
+        "drawin_version": __version__,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "params": {"lengths": list(lengths), "samples": samples, "noise": noise, "seed": seed},
+        "latency": timings,
+        "engines": {engine: accuracy(matrix) for engine, matrix in confusion.items()},
+    }
+    # Compatibilidad con informes anteriores: la precisión principal es la de las reglas
+    report.update(report["engines"]["rules"])
+    return report
+
+
+def compare_benchmarks(baseline, current):
+    # Cociente de medianas (actual / referencia) por detector y longitud
+    lines = []
+    for name, by_length in current["latency"].items():
+        for length, summary in by_length.items():
+            base = baseline.get("latency", {}).get(name, {}).get(length)
+            if base and base["median_us"]:
+                ratio = summary["median_us"] / base["median_us"]
+                lines.append(f"{name:18} {length:>6} pts  {base['median_us']:10.1f} -> "
+                             f"{summary['median_us']:10.1f} us  x{ratio:.2f}")
+    for engine, result in current["engines"].items():
+        base = baseline.get("engines", {}).get(engine, {"accuracy": baseline.get("accuracy", 0)}
+                                               if engine == "rules" else {})
+        if "accuracy" in base:
+            lines.append(f"precisión {engine}: {base['accuracy']:.3f} -> {result['accuracy']:.3f}")
+    return "\n".join(lines)
+
+
+# ==============================================
+# Reconocedor por mapas de bits
+# ==============================================
+# Cada trazo se rasteriza en una rejilla pequeña y se compara por similitud
+# del coseno con un banco de prototipos. El banco es un fichero que se abre
+# con np.memmap: una firma, una cabecera JSON y los datos en crudo, así que
+# se carga sin leerlo entero y varios procesos comparten las mismas páginas.
+
+BANK_MAGIC = b"DRWP"
+BANK_HEADER = struct.Struct("<4sI")   # firma, longitud de la cabecera JSON
+BANK_VERSION = 1
+BANK_ALIGN = 64
+
+
+def rasterize_strokes(strokes, size=24, samples=None):
+    # Matriz (n_trazos, size*size) float32 con una fila de norma 1 por trazo.
+    # El trazo se escala a la rejilla manteniendo la proporción, se muestrea
+    # densamente, se marca cada celda tocada y se engorda con un filtro 3x3
+    # para tolerar el temblor de la mano.
+    samples = samples or 4 * size
+    strokes = list(strokes)
+    xy = np.empty((len(strokes), samples, 2))
+    for i, points in enumerate(strokes):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xy[i] = _resample_xy(points, samples) if len(points) else 0.0
+    low = xy.min(axis=1, keepdims=True)
+    extent = (xy.max(axis=1, keepdims=True) - low).max(axis=2, keepdims=True)
+    scale = (size - 3) / np.maximum(extent, 1e-9)
+    offset = (size - 1 - (xy.max(axis=1, keepdims=True) - low) * scale) / 2
+    cells = np.rint((xy - low) * scale + offset).astype(np.intp)
+
+    bitmaps = np.zeros((len(strokes), size + 2, size + 2), dtype=np.float32)
+    rows = np.repeat(np.arange(len(strokes)), samples)
+    bitmaps[rows, cells[..., 1].ravel() + 1, cells[..., 0].ravel() + 1] = 1.0
+    blurred = sum(bitmaps[:, dy:dy + size, dx:dx + size] for dy in range(3) for dx in range(3))
+    vectors = blurred.reshape(len(strokes), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-9)
+
+
+def bank_fingerprint(size=24, samples=40, noise=2.0, seed=0):
+    # Huella de todo lo que determina el contenido del banco: el formato, los
+    # parámetros de construcción y los contornos de las plantillas
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([BANK_VERSION, size, samples, noise, seed]).encode("utf-8"))
+    for name in TEMPLATES:
+        digest.update(name.encode("utf-8"))
+        digest.update(np.asarray(template_display_list(name).outline(), dtype="<f8").tobytes())
+    return digest.hexdigest()
+
+
+def build_prototype_bank(path, size=24, samples=40, noise=2.0, seed=0):
+    # Prototipos de cada objeto: su contorno, su silueta y trazos sintéticos.
+    # Se guardan agrupados por clase para reducir por clase con reduceat.
+    rng = random.Random(seed)
+    classes = list(TEMPLATES)
+    strokes, counts = [], []
+    for name in classes:
+        outline = template_display_list(name).outline()
+        strokes += [outline, convex_hull(outline)]
+        strokes += [synthesize_stroke(name, 128, noise, rng) for _ in range(samples)]
+        counts.append(samples + 2)
+    vectors = rasterize_strokes(strokes, size)
+
+    header = json.dumps({"version": BANK_VERSION, "fingerprint": bank_fingerprint(size, samples, noise, seed),
+                         "size": size, "classes": classes, "counts": counts}).encode("utf-8")
+    data_offset = -(-(BANK_HEADER.size + len(header)) // BANK_ALIGN) * BANK_ALIGN
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(BANK_HEADER.pack(BANK_MAGIC, len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_offset - f.tell()))
+        f.write(vectors.astype("<f4").tobytes())
+    os.replace(temporary, path)
+    return path
+
+
+def load_prototype_bank(path):
+    # (cabecera, matriz de prototipos en memmap de solo lectura)
+    with open(path, "rb") as f:
+        magic, header_size = BANK_HEADER.unpack(f.read(BANK_HEADER.size))
+        if magic != BANK_MAGIC:
+            raise ValueError(f"{path} no es un banco de prototipos de Drawin")
+        header = json.loads(f.read(header_size))
+    if header["version"] != BANK_VERSION:
+        raise ValueError(f"Versión de banco no soportada: {header['version']}")
+    data_offset = -(-(BANK_HEADER.size + header_size) // BANK_ALIGN) * BANK_ALIGN
+    shape = (sum(header["counts"]), header["size"] ** 2)
+    return header, np.memmap(path, dtype="<f4", mode="r", offset=data_offset, shape=shape)
+
+
+class BitmapRecognizer:
+    # Vecino más cercano sobre mapas de bits. Interfaz igual que
+    # TemplateRecognizer (prepare, recognize) más recognize_batch.
+
+    def __init__(self, bank_path=None, size=24, samples=40, noise=2.0, seed=0):
+        self.size = size
+        self.build_params = (size, samples, noise, seed)
+        self.bank_path = Path(bank_path) if bank_path else cache_dir() / f"prototipos-{size}.bin"
+        self.classes = None
+        self._bank = None
+
+    def prepare(self):
+        # Abre el banco; lo genera la primera vez o si se construyó con otros
+        # parámetros o con otras plantillas
+        if self._bank is not None:
+            return
+        try:
+            header, bank = load_prototype_bank(self.bank_path)
+            if header["fingerprint"] != bank_fingerprint(*self.build_params):
+                raise ValueError("banco desactualizado")
+        except (OSError, ValueError, KeyError):
+            build_prototype_bank(self.bank_path, *self.build_params)
+            header, bank = load_prototype_bank(self.bank_path)
+        self.classes = header["classes"]
+        self._starts = np.cumsum([0] + header["counts"][:-1])
+        self._bank = bank
+
+    def recognize_batch(self, strokes, top=3):
+        # Una lista [(nombre, puntuación), ...] por trazo con un solo producto de matrices
+        self.prepare()
+        strokes = list(strokes)
+        # Sin resultado para trazos degenerados o con coordenadas no finitas
+        valid = [i for i, points in enumerate(strokes)
+                 if len(points) >= 3 and len(set(map(tuple, points))) > 1
+                 and np.isfinite(np.asarray(points, dtype=np.float64)).all()]
+        results = [[] for _ in strokes]
+        if not valid:
+            return results
+        scores = rasterize_strokes([strokes[i] for i in valid], self.size) @ self._bank.T
+        best = np.maximum.reduceat(scores, self._starts, axis=1)
+        order = np.argsort(-best, axis=1)[:, :top]
+        for row, i in enumerate(valid):
+            results[i] = [(self.classes[c], float(best[row, c])) for c in order[row]]
+        return results
+
+    def recognize(self, points, top=3):
+        return self.recognize_batch([points], top)[0]
+
+
+# Motores que ordenan los 15 objetos (los candidatos que ofrece la interfaz)
+RANKING_ENGINES = {"templates": TemplateRecognizer, "bitmap": BitmapRecognizer}
+
+
+# ==============================================
+# Grabación y reproducción de sesiones
+# ==============================================
+# Fichero binario de solo añadir: una cabecera y registros fijos de 9 bytes
+# (evento u8, milisegundos desde el inicio u32, x int16, y int16).
+
+SESSION_MAGIC = b"DRWS"
+SESSION_HEADER = struct.Struct("<4sBd")   # firma, versión, inicio (epoch)
+SESSION_RECORD = struct.Struct("<BIhh")
+SESSION_DTYPE = np.dtype([("event", "u1"), ("t", "<u4"), ("x", "<i2"), ("y", "<i2")])
+
+# Eventos del lienzo y de los botones
+EVENT_PRESS, EVENT_MOTION, EVENT_RELEASE = 1, 2, 3
+EVENT_CLEAR, EVENT_UNDO, EVENT_GUESS, EVENT_TRANSFORM, EVENT_SAVE = 10, 11, 12, 13, 14
+EVENT_NAMES = {EVENT_PRESS: "press", EVENT_MOTION: "motion", EVENT_RELEASE: "release",
+               EVENT_CLEAR: "clear", EVENT_UNDO: "undo", EVENT_GUESS: "guess",
+               EVENT_TRANSFORM: "transform", EVENT_SAVE: "save"}
+
+
+class SessionRecorder:
+    # Añade eventos a un fichero de sesión. Si el fichero ya existe se sigue
+    # escribiendo a continuación con los tiempos relativos a su cabecera.
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.started = time.time()
+            self.file.write(SESSION_HEADER.pack(SESSION_MAGIC, 1, self.started))
+        else:
+            with open(path, "rb") as f:
+                _, _, self.started = SESSION_HEADER.unpack(f.read(SESSION_HEADER.size))
+        self._clock_offset = self.started - time.time() + time.perf_counter()
+
+    def record(self, event, x=0, y=0):
+        elapsed = int((time.perf_counter() - self._clock_offset) * 1000)
+        self.file.write(SESSION_RECORD.pack(event, elapsed & 0xFFFFFFFF, _clamp16(x), _clamp16(y)))
+        if event != EVENT_MOTION:
+            self.file.flush()
+
+    def wrap(self, event, handler):
+        # Manejador que graba el evento (con sus coordenadas, si las tiene) y luego lo atiende
+        def recorded(*args):
+            if args and hasattr(args[0], "x"):
+                self.record(event, args[0].x, args[0].y)
+            else:
+                self.record(event)
+            return handler(*args)
+        return recorded
+
+    def close(self):
+        self.file.close()
+
+
+class SessionReader:
+    # Abre una sesión con mmap y expone los eventos como array estructurado de
+    # NumPy sin copiarlos. Un registro final incompleto (p. ej. tras un
+    # cierre brusco) se ignora.
+
+    def __init__(self, path):
+        import mmap
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.started = SESSION_HEADER.unpack_from(self.mmap)
+        if magic != SESSION_MAGIC:
+            raise ValueError(f"{path} no es una sesión de Drawin")
+        count = (len(self.mmap) - SESSION_HEADER.size) // SESSION_RECORD.size
+        self.events = np.frombuffer(self.mmap, dtype=SESSION_DTYPE, count=count,
+                                    offset=SESSION_HEADER.size)
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        for event, t, x, y in self.events.tolist():
+            yield event, t, x, y
+
+
+def _pace(start, t_ms, speed):
+    # Espera hasta el instante t_ms de la sesión (speed = 1 es tiempo real)
+    delay = start + t_ms / 1000 / speed - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def replay_session(path, recognizer=None, matcher=None, realtime=False, speed=1.0):
+    # Reproduce una sesión sin interfaz: reconstruye el dibujo trazo a trazo
+    # y lo reconoce en cada "soltar" y cada "deshacer" con las mismas reglas
+    # que DrawinApp: deshacer no hace nada mientras se dibuja ni después de
+    # transformar, transformar sin adivinanza no cuenta y el siguiente trazo
+    # tras transformar empieza un dibujo nuevo. Lo que no se graba (elegir
+    # otro candidato o escribir el objeto en el diálogo) no se reproduce.
+    # Devuelve la lista de reconocimientos y las estadísticas de rendimiento.
+    recognizer = recognizer or DrawinRecognizer()
+    matcher = matcher or TemplateRecognizer()
+    matcher.prepare()
+    reader = SessionReader(path)
+    sketch = Sketch()
+    accumulator = FeatureAccumulator()
+    results = []
+    recognition_ns = 0
+    start = time.perf_counter()
+    drawing = transformed = False
+    guess = None
+    for event, t, x, y in reader:
+        if realtime:
+            _pace(start, t, speed)
+        if event == EVENT_PRESS:
+            if transformed:
+                sketch.clear()
+                accumulator.reset()
+                transformed = False
+            drawing = True
+            guess = None
+            sketch.begin_stroke(x, y)
+            accumulator.break_stroke()
+            accumulator.add(x, y)
+        elif event == EVENT_MOTION and drawing:
+            sketch.add_point(x, y)
+            accumulator.add(x, y)
+        elif (event == EVENT_RELEASE and drawing) or (event == EVENT_UNDO and not drawing and not transformed
+                                                       and sketch.stroke_count):
+            drawing = False
+            guess = None
+            if event == EVENT_UNDO:
+                sketch.undo()
+                accumulator.reset()
+                accumulator.add_sketch(sketch)
+                if not len(sketch):
+                    continue
+            points = sketch.points()
+            begin = time.perf_counter_ns()
+            guess, _ = recognizer.analyze(points, accumulator)
+            candidates = matcher.recognize(points)
+            recognition_ns += time.perf_counter_ns() - begin
+            if not guess and candidates:
+                guess = candidates[0][0]
+            results.append({"t": t, "event": EVENT_NAMES[event], "strokes": sketch.stroke_count,
+                            "points": len(sketch), "guess": guess, "candidates": candidates})
+        elif event == EVENT_CLEAR:
+            sketch.clear()
+            accumulator.reset()
+            drawing = transformed = False
+            guess = None
+        elif event == EVENT_TRANSFORM and guess:
+            transformed = True
+    elapsed = time.perf_counter() - start
+    stats = {
+        "events": len(reader),
+        "recognitions": len(results),
+        "seconds": elapsed,
+        "events_per_second": len(reader) / elapsed if elapsed else 0.0,
+        "mean_recognition_ms": recognition_ns / 1e6 / len(results) if results else 0.0,
+        "session_seconds": int(reader.events["t"][-1]) / 1000 if len(reader) else 0.0,
+    }
+    return results, stats
+
+
+def replay_session_gui(app, path, realtime=False, speed=1.0, on_done=None):
+    # Reproduce una sesión a través de los manejadores de la interfaz,
+    # programando cada evento con root.after (sin pausas si no es en tiempo real).
+    # Antes de cada evento que no sea un movimiento se espera a que termine el
+    # reconocimiento en curso, como hizo el usuario al grabar: si no, un
+    # deshacer podría adelantarse a una transformación aún pendiente.
+    reader = SessionReader(path)
+    handlers = {
+        EVENT_PRESS: app.start_drawing, EVENT_MOTION: app.draw, EVENT_RELEASE: app.stop_drawing,
+        EVENT_CLEAR: app.clear_canvas, EVENT_UNDO: app.undo_stroke, EVENT_GUESS: app.guess_drawing,
+        EVENT_TRANSFORM: app.transform_drawing, EVENT_SAVE: app.save_drawing,
+    }
+    events = iter(reader)
+    start = time.perf_counter()
+    held = []
+
+    def step():
+        # Atiende todos los eventos que ya tocan y cede el control a Tk
+        while True:
+            event = held.pop() if held else next(events, None)
+            if event is None:
+                if on_done:
+                    on_done()
+                return
+            code, t, x, y = event
+            if code != EVENT_MOTION and app._pending_final is not None:
+                held.append(event)
+                app.root.after(5, step)
+                return
+            if code in (EVENT_PRESS, EVENT_MOTION, EVENT_RELEASE):
+                handlers[code](SimpleNamespace(x=x, y=y))
+            else:
+                handlers[code]()
+            if realtime:
+                delay = start + t / 1000 / speed - time.perf_counter()
+                if delay > 0:
+                    app.root.after(int(delay * 1000), step)
+                    return
+            elif code == EVENT_RELEASE:
+                app.root.after(1, step)
+                return
+    app.root.after(0, step)
+
+
+# ==============================================
+# Servicio de reconocimiento local
+# ==============================================
+# Protocolo NDJSON sobre un socket Unix o TCP en localhost. Cada línea es
+# {"id": ..., "points": [[x, y], ...]} (o solo la lista de puntos) y la
+# respuesta {"id": ..., "guess": ..., "candidates": [...], "cached": bool}.
+# {"stats": true} devuelve las estadísticas del servicio.
+
+def stroke_key(points, grid=4):
+    # Huella del trazo sin su posición: se lleva a la esquina (0, 0), se
+    # cuantiza a una rejilla de grid píxeles y se resume con BLAKE2
+    xy = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(xy):
+        return b""
+    quantized = np.rint((xy - xy.min(axis=0)) / grid).astype("<i4")
+    import hashlib
+    return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+
+class RecognitionServer:
+    # Junta las peticiones que llegan a la vez en un lote (hasta max_batch o
+    # batch_window_ms) y lo pasa por analyze_batch y el motor de candidatos
+    # en un hilo aparte, para que el bucle de asyncio siga aceptando
+    # peticiones. Los resultados se guardan en una caché LRU por stroke_key.
+
+    def __init__(self, recognizer=None, matcher=None, max_batch=64, batch_window_ms=2,
+                 cache_size=4096, grid=4, max_line_bytes=16 * 1024 * 1024):
+        self.recognizer = recognizer or DrawinRecognizer()
+        self.matcher = matcher or TemplateRecognizer()
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000
+        self.cache_size = cache_size
+        self.grid = grid
+        # Un trazo largo de tableta ocupa cientos de KB en una sola línea; el
+        # límite por defecto de asyncio (64 KiB) los cortaría
+        self.max_line_bytes = max_line_bytes
+        self.cache = {}      # clave -> resultado, del menos al más reciente
+        self.inflight = {}   # clave -> future de un trazo igual que ya está en cola
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.started = time.perf_counter()
+        self.counters = {"requests": 0, "cache_hits": 0, "coalesced": 0, "batches": 0,
+                         "batched_strokes": 0, "errors": 0, "max_queue_depth": 0}
+
+    def stats(self):
+        c = self.counters
+        elapsed = time.perf_counter() - self.started
+        return {
+            "requests": c["requests"],
+            "throughput_per_s": c["requests"] / elapsed if elapsed else 0.0,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_queue_depth": c["max_queue_depth"],
+            "cache_size": len(self.cache),
+            "cache_hit_rate": c["cache_hits"] / c["requests"] if c["requests"] else 0.0,
+            "coalesced": c["coalesced"],
+            "batches": c["batches"],
+            "mean_batch_size": c["batched_strokes"] / c["batches"] if c["batches"] else 0.0,
+            "errors": c["errors"],
+            "uptime_s": elapsed,
+        }
+
+    def _cached(self, key):
+        result = self.cache.pop(key, None)
+        if result is not None:
+            self.cache[key] = result
+        return result
+
+    def _remember(self, key, result):
+        self.cache[key] = result
+        while len(self.cache) > self.cache_size:
+            del self.cache[next(iter(self.cache))]
+
+    def recognize_batch(self, strokes):
+        # Se ejecuta en el hilo del servicio: mismas reglas y candidatos que la interfaz
+        guesses = self.recognizer.analyze_batch(strokes)
+        ranked = self.matcher.recognize_batch(strokes)
+        return [{"guess": guess or (candidates[0][0] if candidates else None),
+                 "candidates": [[name, round(score, 4)] for name, score in candidates]}
+                for guess, candidates in zip(guesses, ranked)]
+
+    async def recognize(self, points):
+        import asyncio
+        self.counters["requests"] += 1
+        key = stroke_key(points, self.grid)
+        result = self._cached(key)
+        if result is not None:
+            self.counters["cache_hits"] += 1
+            return dict(result, cached=True)
+        future = self.inflight.get(key)
+        if future is not None:
+            # El mismo trazo ya va en un lote: se espera a ese resultado
+            self.counters["coalesced"] += 1
+            return dict(await asyncio.shield(future), cached=True)
+        future = self.inflight[key] = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((key, points, future))
+        self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queue.qsize())
+        return dict(await asyncio.shield(future), cached=False)
+
+    async def _batcher(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Un lote que falla responde con error a sus peticiones y el bucle sigue
+            error = results = None
+            try:
+                results = await loop.run_in_executor(self.executor, self.recognize_batch,
+                                                      [points for _, points, _ in batch])
+            except Exception as e:
+                error = e
+                self.counters["errors"] += len(batch)
+            else:
+                self.counters["batches"] += 1
+                self.counters["batched_strokes"] += len(batch)
+            for i, (key, _, future) in enumerate(batch):
+                self.inflight.pop(key, None)
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    self._remember(key, results[i])
+                    future.set_result(results[i])
+
+    async def _respond(self, request, writer):
+        request_id = None
+        try:
+            if isinstance(request, dict) and request.get("stats"):
+                response = {"stats": self.stats()}
+            else:
+                if isinstance(request, dict):
+                    request_id, points = request.get("id"), request["points"]
+                else:
+                    points = request
+                points = [(float(x), float(y)) for x, y in points]
+                if not all(math.isfinite(x) and math.isfinite(y) for x, y in points):
+                    raise ValueError("los puntos deben ser números finitos")
+                response = await self.recognize(points)
+        except Exception as e:
+            response = {"error": str(e)}
+        if request_id is not None:
+            response["id"] = request_id
+        writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    async def handle_client(self, reader, writer):
+        # Las peticiones de una conexión se atienden a la vez; las respuestas
+        # salen cuando terminan, con su id para emparejarlas
+        import asyncio
+        pending = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # readline ya descartó la línea demasiado larga
+                    self.counters["errors"] += 1
+                    error = f"Línea de más de {self.max_line_bytes} bytes"
+                    writer.write((json.dumps({"error": error}) + "\n").encode("utf-8"))
+                    continue
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    writer.write((json.dumps({"error": f"JSON no válido: {e}"}) + "\n").encode("utf-8"))
+                    continue
+                task = asyncio.create_task(self._respond(request, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                await writer.drain()
+            if pending:
+                await asyncio.wait(pending)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host="127.0.0.1", port=8765, stats_interval=None):
+        import asyncio
+        self.queue = asyncio.Queue()
+        self.started = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.matcher.prepare)
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path,
+                                                     limit=self.max_line_bytes)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, limit=self.max_line_bytes)
+        batcher = asyncio.create_task(self._batcher())
+        where = socket_path or f"{host}:{port}"
+        print(f"Drawin escuchando en {where}", file=sys.stderr)
+        try:
+            async with server:
+                if stats_interval:
+                    while True:
+                        await asyncio.sleep(stats_interval)
+                        print(json.dumps(self.stats()), file=sys.stderr)
+                else:
+                    await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+
+
+# ==============================================
+# Línea de comandos y procesamiento por lotes
+# ==============================================
+
+def read_stroke_records(path):
+    # Registros (id, puntos, error) de un fichero JSON (lista) o NDJSON (uno
+    # por línea). Cada registro es una lista de puntos [[x, y], ...] o un
+    # objeto {"id": ..., "points": [...]}. "-" lee NDJSON de la entrada
+    # estándar. Un registro mal formado no detiene el resto: sale con
+    # puntos None y el motivo en error.
+    def record(item, index):
+        stroke_id = f"{path}:{index}"
+        try:
+            if isinstance(item, dict):
+                stroke_id = item.get("id", stroke_id)
+                if "points" not in item:
+                    raise ValueError("falta 'points'")
+                item = item["points"]
+            points = [(float(x), float(y)) for x, y in item]
+            if not all(math.isfinite(x) and math.isfinite(y) for x, y in points):
+                raise ValueError("los puntos deben ser números finitos")
+        except (TypeError, ValueError) as e:
+            return stroke_id, None, f"registro no válido: {e}"
+        return stroke_id, points, None
+
+    if path == "-":
+        lines = sys.stdin
+    else:
+        try:
+            lines = open(path, encoding="utf-8")
+        except OSError as e:
+            yield path, None, str(e)
+            return
+    try:
+        if path.endswith(".json"):
+            try:
+                items = json.load(lines)
+            except ValueError as e:
+                yield path, None, f"JSON no válido: {e}"
+                return
+            if not isinstance(items, list):
+                yield path, None, f"se esperaba una lista de trazos, no {type(items).__name__}"
+                return
+            for index, item in enumerate(items):
+                yield record(item, index)
+            return
+        for index, line in enumerate(lines):
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    yield f"{path}:{index}", None, f"JSON no válido: {e}"
+                    continue
+                yield record(item, index)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Estado de cada proceso del pool (se inicializa una vez por proceso)
+_worker = {}
+
+
+def _init_worker(preprocess, png_dir, scale, engine="rules"):
+    preprocessor = StrokePreprocessor(*preprocess) if preprocess else None
+    _worker["recognizer"] = DrawinRecognizer(preprocessor)
+    _worker["engine"] = engine
+    if engine in RANKING_ENGINES:
+        _worker["matcher"] = RANKING_ENGINES[engine]()
+    _worker["png_dir"] = png_dir
+    _worker["scale"] = scale
+
+
+def _classify_strokes(strokes):
+    # (adivinanzas, candidatos o None) de una lista de trazos válidos
+    if _worker["engine"] in RANKING_ENGINES:
+        ranked = _worker["matcher"].recognize_batch(strokes)
+        return [candidates[0][0] if candidates else None for candidates in ranked], ranked
+    return _worker["recognizer"].analyze_batch(strokes), None
+
+
+def _classify_record(stroke_id, points):
+    result = {"id": stroke_id}
+    try:
+        (guess,), ranked = _classify_strokes([points])
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["guess"] = guess
+    if ranked is not None:
+        result["candidates"] = ranked[0]
+    return result
+
+
+def _classify_chunk(chunk):
+    # Se clasifica el bloque entero de una vez; si algo falla, registro a
+    # registro para que el error quede solo en el trazo que lo provoca
+    valid = [(stroke_id, points) for stroke_id, points, error in chunk if error is None]
+    try:
+        guesses, ranked = _classify_strokes([points for _, points in valid])
+    except Exception:
+        by_id = [_classify_record(stroke_id, points) for stroke_id, points in valid]
+    else:
+        by_id = []
+        for i, ((stroke_id, _), guess) in enumerate(zip(valid, guesses)):
+            result = {"id": stroke_id, "guess": guess}
+            if ranked is not None:
+                result["candidates"] = ranked[i]
+            by_id.append(result)
+    classified = iter(by_id)
+    results = []
+    for stroke_id, _, error in chunk:
+        result = {"id": stroke_id, "error": error} if error is not None else next(classified)
+        guess = result.get("guess")
+        if guess and _worker["png_dir"]:
+            safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(stroke_id))
+            filepath = os.path.join(_worker["png_dir"], f"{safe_id}_{guess}.png")
+            try:
+                result["png"] = save_png(render_template(guess, _worker["scale"]), filepath)
+            except (OSError, ValueError) as e:
+                result["error"] = f"no se pudo guardar el PNG: {e}"
+        results.append(result)
+    return results
+
+
+def classify_files(paths, workers=None, chunk_size=256, png_dir=None, scale=1, preprocess=None,
+                   engine="rules"):
+    # Clasifica los trazos de todos los ficheros repartiendo bloques entre un
+    # pool de procesos; los resultados salen en orden a medida que terminan.
+    records = (record for path in paths for record in read_stroke_records(path))
+    chunks = _chunked(records, chunk_size)
+    initargs = (preprocess, png_dir, scale, engine)
+    if workers == 1:
+        _init_worker(*initargs)
+        for chunk in chunks:
+            yield from _classify_chunk(chunk)
+        return
+    import multiprocessing
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        for results in pool.imap(_classify_chunk, chunks):
+            yield from results
+
+
+def run_gui(show_splash=True, timeline=None, metrics_path=None, record_path=None,
+            replay_paths=(), replay_realtime=False, replay_speed=1.0, replay_interactive=False,
+            replay_output_dir=None, engine="templates", sheet=False):
+    timeline = timeline or StartupTimeline()
+    metrics = LatencyMetrics() if metrics_path else None
+    recorder = SessionRecorder(record_path) if record_path else None
+    base_dir = os.path.dirname(os.path.abspath(__file__))
     root = tk.Tk()
+    root.withdraw()  # Ocultar la ventana principal mientras se construye
+    timeline.mark("Tk iniciado")
     
-    # Mostrar splash screen (asegúrate de tener el archivo splash.png en el mismo directorio)
-    splash_image = "drawin_splash.png"  # Ruta del archivo de splash
-    if os.path.exists(splash_image):
-        splash = SplashScreen(tk.Toplevel(), splash_image, 2500)
-        root.withdraw()  # Ocultar la ventana principal mientras se muestra el splash
-        root.after(2500, root.deiconify)  # Mostrar la ventana principal después
+    # Mostrar el splash mientras se construye la aplicación
+    splash = None
+    splash_image = os.path.join(base_dir, "drawin_splash.png")
+    if show_splash and os.path.exists(splash_image):
+        splash = SplashScreen(tk.Toplevel(root), splash_image)
+        root.update_idletasks()
+        splash.root.update()
+        timeline.mark("splash visible")
     
     # Iniciar la aplicación principal
-    app_icon = "drawin_icon.ico" # Ruta del icono de la aplicación
-    app = DrawinApp(root, app_icon)
-    root.mainloop()
\ No newline at end of file
+    app_icon = os.path.join(base_dir, "drawin_icon.ico")
+    app = DrawinApp(root, app_icon, metrics=metrics, recorder=recorder, engine=engine,
+                    sheet=sheet)
+    timeline.mark("aplicación construida")
+    
+    # Cerrar el splash en cuanto la interfaz está lista, sin temporizador fijo
+    def show_main_window():
+        if splash:
+            splash.close()
+        root.deiconify()
+        root.update_idletasks()
+        timeline.mark("ventana principal visible")
+    root.after_idle(show_main_window)
+    
+    def first_stroke(event):
+        if not any(label == "primer trazo" for label, _ in timeline.marks):
+            timeline.mark("primer trazo")
+    app.canvas.bind("<Button-1>", first_stroke, add="+")
+    
+    # Volcado de métricas: F3, cada 10 s y al salir
+    if metrics:
+        def dump_metrics(event=None):
+            metrics.dump(metrics_path)
+            if event is None:
+                root.after(10000, dump_metrics)
+        root.bind("<F3>", dump_metrics)
+        root.after(10000, dump_metrics)
+    
+    # Reproducir sesiones grabadas a través de la interfaz, una tras otra y
+    # empezando cada una con el lienzo limpio. Salvo que se pida lo contrario
+    # no se abren diálogos y solo se guarda si hay carpeta de salida.
+    pending_replays = list(replay_paths)
+    if pending_replays and not replay_interactive:
+        app.interactive = False
+        app.output_dir = replay_output_dir
+    elif replay_output_dir:
+        app.output_dir = replay_output_dir
+    def replay_next():
+        path = pending_replays.pop(0)
+        replay_start = time.perf_counter()
+        def replay_done():
+            elapsed = time.perf_counter() - replay_start
+            print(f"Sesión {path} reproducida en {elapsed:.2f} s", file=sys.stderr)
+            app.status.config(text=f"Sesión reproducida en {elapsed:.2f} s")
+            if pending_replays:
+                app.clear_canvas()
+                root.after_idle(replay_next)
+        replay_session_gui(app, path, replay_realtime, replay_speed, replay_done)
+    if pending_replays:
+        root.after_idle(replay_next)
+    
+    root.mainloop()
+    if metrics:
+        metrics.dump(metrics_path)
+    if recorder:
+        recorder.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="drawin", description="Drawin - Dibuja y Transforma")
+    parser.add_argument("--no-splash", action="store_true", help="arranca sin pantalla de bienvenida")
+    parser.add_argument("--startup-timeline", action="store_true",
+                        help="muestra en stderr los tiempos de arranque")
+    parser.add_argument("--metrics", metavar="FICHERO",
+                        help="mide latencias (F2 muestra la capa, F3 vuelca) y las guarda en FICHERO")
+    parser.add_argument("--record", metavar="FICHERO",
+                        help="graba los trazos y botones de la sesión en FICHERO (binario)")
+    parser.add_argument("--engine", dest="gui_engine", choices=tuple(RANKING_ENGINES), default="templates",
+                        help="motor que ordena los candidatos en la interfaz")
+    parser.add_argument("--sheet", action="store_true",
+                        help="hoja grande con zoom (rueda) y desplazamiento (botón central o derecho)")
+    commands = parser.add_subparsers(dest="command")
+
+    classify = commands.add_parser("classify", help="clasifica trazos de ficheros JSON/NDJSON")
+    classify.add_argument("files", nargs="+", help="ficheros .json o .ndjson ('-' para stdin)")
+    classify.add_argument("-o", "--output", help="fichero NDJSON de salida (por defecto stdout)")
+    classify.add_argument("-j", "--workers", type=int, default=None,
+                          help="procesos del pool (por defecto, uno por núcleo)")
+    classify.add_argument("--chunk-size", type=int, default=256, help="trazos por bloque de trabajo")
+    classify.add_argument("--png-dir", help="guarda el PNG de la plantilla reconocida en esta carpeta")
+    classify.add_argument("--scale", type=float, default=1, help="escala de los PNG (1 = 500x500)")
+    classify.add_argument("--engine", choices=("rules", *RANKING_ENGINES), default="rules",
+                          help="reglas geométricas, plantillas o mapas de bits "
+                               "(los dos últimos devuelven también el top 3)")
+    classify.add_argument("--resample", type=int, default=0, help="remuestrea cada trazo a N puntos")
+    classify.add_argument("--epsilon", type=float, default=0, help="tolerancia de simplificación RDP")
+
+    bench = commands.add_parser("bench", help="mide latencia y precisión del reconocedor")
+    bench.add_argument("--lengths", default="32,128,512,2048",
+                       help="longitudes de trazo separadas por comas")
+    bench.add_argument("--samples", type=int, default=10, help="trazos por objeto y longitud")
+    bench.add_argument("--noise", type=float, default=2.0, help="desviación del temblor en píxeles")
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("-o", "--output", help="guarda el resultado JSON en este fichero")
+    bench.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+
+    replay = commands.add_parser("replay", help="reproduce sesiones grabadas con --record")
+    replay.add_argument("files", nargs="+", help="ficheros de sesión")
+    replay.add_argument("--gui", action="store_true", help="reproduce a través de la interfaz")
+    replay.add_argument("--realtime", action="store_true", help="respeta los tiempos originales")
+    replay.add_argument("--speed", type=float, default=1.0, help="factor de velocidad en tiempo real")
+    replay.add_argument("-o", "--output", help="NDJSON con cada reconocimiento (sin interfaz)")
+    replay.add_argument("--interactive", action="store_true",
+                        help="con --gui, muestra los diálogos y guarda en Descargas como al grabar")
+    replay.add_argument("--save-dir", metavar="CARPETA",
+                        help="con --gui, carpeta donde se guardan los PNG (por defecto no se guardan)")
+
+    serve = commands.add_parser("serve", help="servicio de reconocimiento local (NDJSON)")
+    serve.add_argument("--socket", metavar="RUTA", help="socket Unix (por defecto, TCP en localhost)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--engine", choices=tuple(RANKING_ENGINES), default="templates",
+                       help="motor de los candidatos")
+    serve.add_argument("--batch", type=int, default=64, help="trazos máximos por lote")
+    serve.add_argument("--window-ms", type=float, default=2, help="espera máxima para llenar un lote")
+    serve.add_argument("--cache-size", type=int, default=4096, help="resultados en la caché LRU")
+    serve.add_argument("--stats-interval", type=float, default=10,
+                       help="segundos entre estadísticas en stderr (0 = nunca)")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        run_gui(show_splash=not args.no_splash, timeline=StartupTimeline(echo=args.startup_timeline),
+                metrics_path=args.metrics, record_path=args.record, engine=args.gui_engine,
+                sheet=args.sheet)
+        return
+
+    if args.command == "serve":
+        import asyncio
+        server = RecognitionServer(matcher=RANKING_ENGINES[args.engine](), max_batch=args.batch,
+                                   batch_window_ms=args.window_ms, cache_size=args.cache_size)
+        try:
+            asyncio.run(server.serve(args.socket, args.host, args.port, args.stats_interval))
+        except KeyboardInterrupt:
+            print(json.dumps(server.stats()), file=sys.stderr)
+
+    if args.command == "replay":
+        if args.gui:
+            run_gui(show_splash=False, replay_paths=args.files, replay_realtime=args.realtime,
+                    replay_speed=args.speed, replay_interactive=args.interactive,
+                    replay_output_dir=args.save_dir, engine=args.gui_engine, sheet=args.sheet)
+            return
+        out = open(args.output, "w", encoding="utf-8") if args.output else None
+        try:
+            for path in args.files:
+                results, stats = replay_session(path, realtime=args.realtime, speed=args.speed)
+                if out:
+                    for result in results:
+                        out.write(json.dumps(dict(result, session=path), ensure_ascii=False) + "\n")
+                print(json.dumps(dict(stats, session=path), ensure_ascii=False), file=sys.stderr)
+        finally:
+            if out:
+                out.close()
+
+    if args.command == "bench":
+        lengths = tuple(int(n) for n in args.lengths.split(","))
+        report = run_benchmark(lengths, args.samples, args.noise, args.seed)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                print(compare_benchmarks(json.load(f), report), file=sys.stderr)
+
+    if args.command == "classify":
+        preprocess = (args.resample, args.epsilon) if args.resample or args.epsilon else None
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            for result in classify_files(args.files, args.workers, args.chunk_size,
+                                         args.png_dir, args.scale, preprocess, args.engine):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+# Configuración inicial
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drawin
+
+
+class ClassifyFilesTest(unittest.TestCase):
+
+    def test_malformed_records_do_not_stop_the_batch(self):
+        lines = ['{"id": "a", "points": [[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]}',
+                 'no es json',
+                 '{"id": "b"}',
+                 '{"id": "c", "points": [[0, 0], [NaN, 1], [2, 2]]}',
+                 '[[0, 0], [50, 50], [100, 0]]']
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trazos.ndjson")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            for engine in ("rules", "templates"):
+                results = list(drawin.classify_files([path], workers=1, engine=engine))
+                self.assertEqual(len(results), len(lines))
+                self.assertEqual([("error" in result) for result in results],
+                                 [False, True, True, True, False])
+                self.assertIn("guess", results[0])
+
+    def test_json_top_level_must_be_a_list(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name, text in (("numero.json", "5"), ("objeto.json", '{"id": "a", "points": []}')):
+                paths.append(os.path.join(tmp, name))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    f.write(text)
+            results = list(drawin.classify_files(paths, workers=1))
+            self.assertEqual([result["id"] for result in results], paths)
+            self.assertTrue(all("error" in result for result in results))
+
+    def test_png_failure_stays_in_its_record(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trazos.ndjson")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('[[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]\n' * 2)
+            # Un fichero en lugar de la carpeta de salida: no se puede escribir en ella
+            png_dir = os.path.join(tmp, "no-es-carpeta")
+            open(png_dir, "w").close()
+            results = list(drawin.classify_files([path], workers=1, png_dir=png_dir, engine="templates"))
+            self.assertEqual(len(results), 2)
+            self.assertTrue(all(result["guess"] and "error" in result for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
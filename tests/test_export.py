@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drawin
+
+SVG_TAGS = {"line": "polyline", "polygon": "polygon", "oval": "ellipse", "rectangle": "rect", "text": "text"}
+
+EXTRA = [
+    ("text", (250, 40), {"text": 'a < b & "c" (d)', "fill": "red", "font": ("Arial", 18)}),
+    ("rectangle", (10, 20, 60, 90), {"fill": "", "outline": "blue", "width": 2}),
+]
+
+
+def all_primitives():
+    primitives = []
+    for name in drawin.TEMPLATES:
+        primitives += drawin.template_display_list(name).primitives
+    return primitives + EXTRA
+
+
+class VectorExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_svg_has_one_element_per_primitive(self):
+        primitives = all_primitives()
+        path = drawin.export_vector(primitives, os.path.join(self.tmp.name, "dibujo.svg"), 640, 480)
+        root = ET.parse(path).getroot()
+        self.assertEqual((root.get("width"), root.get("height")), ("640", "480"))
+        tags = [element.tag.split("}")[1] for element in root]
+        # El primer rectángulo es el fondo
+        self.assertEqual(tags[1:], [SVG_TAGS[kind] for kind, _, _ in primitives])
+        text = root[len(primitives) - 1]
+        self.assertEqual(text.text, 'a < b & "c" (d)')
+        self.assertEqual((text.get("fill"), text.get("font-size")), ("#ff0000", "18"))
+        rect = root[len(primitives)]
+        self.assertEqual([rect.get(k) for k in ("x", "y", "width", "height", "fill", "stroke")],
+                         ["10", "20", "50", "70", "none", "#0000ff"])
+
+    def test_pdf_structure(self):
+        primitives = all_primitives()
+        path = drawin.export_vector(primitives, os.path.join(self.tmp.name, "dibujo.pdf"), 640, 480)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b"%PDF-1.4"))
+        self.assertTrue(data.endswith(b"%%EOF\n"))
+        # La tabla xref apunta al principio de cada objeto
+        xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+        self.assertTrue(data[xref:].startswith(b"xref\n0 7\n"))
+        offsets = [int(n) for n in re.findall(rb"(\d{10}) 00000 n", data[xref:])]
+        for number, offset in enumerate(offsets, 1):
+            self.assertTrue(data[offset:].startswith(b"%d 0 obj" % number))
+        self.assertIn(b"/MediaBox [0 0 640 480]", data)
+        # El flujo mide lo que dice el objeto 5 y se descomprime entero
+        start = data.index(b"stream\n") + len(b"stream\n")
+        length = int(re.search(rb"5 0 obj\n(\d+)", data).group(1))
+        self.assertEqual(data[start + length:start + length + len(b"\nendstream")], b"\nendstream")
+        content = zlib.decompress(data[start:start + length]).decode("latin-1")
+        # Una orden de pintar por primitiva (el fondo va en su misma línea)
+        painted = sum(1 for line in content.splitlines() if line in ("S", "f", "B", "n"))
+        self.assertEqual(painted + content.count(" Tj ET"), len(primitives))
+        self.assertIn(r'(a < b & "c" \(d\)) Tj', content)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            drawin.export_vector(EXTRA, os.path.join(self.tmp.name, "dibujo.eps"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drawin
+
+
+def baseline_angles(points):
+    angles = []
+    for i in range(1, len(points) - 1):
+        x1, y1 = points[i - 1]
+        x2, y2 = points[i]
+        x3, y3 = points[i + 1]
+        angle = abs(math.degrees(math.atan2(y3 - y2, x3 - x2) - math.atan2(y1 - y2, x1 - x2)))
+        angles.append(360 - angle if angle > 180 else angle)
+    return angles
+
+
+def baseline_heart(points):
+    # Búsqueda por fuerza bruta de la versión original
+    if len(points) < 10:
+        return False
+    centroid_x = sum(p[0] for p in points) / len(points)
+    symmetric = sum(1 for x, y in points
+                    if any(abs(px - (2 * centroid_x - x)) < 20 and abs(py - y) < 20 for px, py in points))
+    return symmetric / len(points) > 0.6
+
+
+def baseline_guess(points):
+    # Reglas de la versión original de Drawin, trazo a trazo y sin NumPy
+    if len(points) < 3:
+        return None
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    width, height = max(xs) - min(xs), max(ys) - min(ys)
+    aspect_ratio = width / height if height != 0 else 1
+    centroid_x, centroid_y = sum(xs) / len(points), sum(ys) / len(points)
+    distances = [math.sqrt((x - centroid_x) ** 2 + (y - centroid_y) ** 2) for x, y in points]
+    avg_distance = sum(distances) / len(distances)
+    circularity = sum(abs(d - avg_distance) for d in distances) / len(distances)
+    angles = baseline_angles(points)
+    long_enough = len(points) >= 10
+    if circularity < 15 and 0.7 < aspect_ratio < 1.3:
+        return "sol"
+    if circularity < 20 and aspect_ratio > 1.5:
+        return "coche"
+    if circularity < 20 and aspect_ratio < 0.7:
+        return "árbol"
+    if long_enough and sum(1 for a in angles if 70 < a < 110) >= 2:
+        return "casa"
+    if long_enough and sum(1 for a in angles if a < 60) >= 5:
+        return "estrella"
+    if baseline_heart(points):
+        return "corazón"
+    upper = [p for p in points if p[1] < sum(ys) / len(points)]
+    if len(upper) >= 3:
+        ux, uy = sum(p[0] for p in upper) / len(upper), sum(p[1] for p in upper) / len(upper)
+        distances = [math.sqrt((x - ux) ** 2 + (y - uy) ** 2) for x, y in upper]
+        avg_distance = sum(distances) / len(distances)
+        if sum(abs(d - avg_distance) for d in distances) / len(distances) < 25:
+            return "globo"
+    if long_enough and 1 <= sum(1 for a in angles if a < 45) <= 3:
+        return "pez"
+    return None
+
+
+def sample_strokes(seed=0):
+    # Trazos sintéticos de los 15 objetos y garabatos al azar, en enteros
+    # como los eventos del ratón, más algunos casos límite
+    rng = random.Random(seed)
+    strokes = [drawin.synthesize_stroke(name, n, noise, rng)
+               for name in drawin.TEMPLATES for n in (12, 40, 150) for noise in (0.5, 4.0)]
+    for _ in range(120):
+        x, y = rng.randint(0, 500), rng.randint(0, 500)
+        stroke = []
+        for _ in range(rng.randint(3, 200)):
+            x, y = x + rng.randint(-15, 15), y + rng.randint(-15, 15)
+            stroke.append((x, y))
+        strokes.append(stroke)
+    strokes += [[(5, 5)] * 12, [(0, 0), (10, 0), (20, 0)], [(0, 0), (0, 10), (0, 20), (0, 30)], [(1, 1)]]
+    return strokes
+
+
+class BatchParityTest(unittest.TestCase):
+
+    def test_analyze_matches_the_original_rules(self):
+        recognizer = drawin.DrawinRecognizer()
+        for points in sample_strokes():
+            with self.subTest(points=points[:3]):
+                self.assertEqual(recognizer.analyze(points)[0], baseline_guess(points))
+
+    def test_analyze_batch_matches_analyze(self):
+        recognizer = drawin.DrawinRecognizer()
+        strokes = sample_strokes(1)
+        self.assertEqual(recognizer.analyze_batch(strokes),
+                         [recognizer.analyze(points)[0] for points in strokes])
+        # También con el preprocesado (RDP y remuestreo) activado
+        recognizer = drawin.DrawinRecognizer(drawin.StrokePreprocessor())
+        self.assertEqual(recognizer.analyze_batch(strokes),
+                         [recognizer.analyze(points)[0] for points in strokes])
+
+    def test_batch_features_match_per_stroke_features(self):
+        recognizer = drawin.DrawinRecognizer()
+        strokes = [points for points in sample_strokes(2) if len(points) >= 3]
+        batch = recognizer.batch_features(strokes)
+        for k, points in enumerate(strokes):
+            features = recognizer.features(points)
+            for name in ("min_x", "max_x", "min_y", "max_y", "aspect_ratio", "circularity"):
+                self.assertAlmostEqual(float(batch[name][k]), features[name], places=9)
+
+
+class PointGridTest(unittest.TestCase):
+
+    def test_has_neighbor_matches_brute_force(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(-50, 250), rng.uniform(-50, 250)) for _ in range(300)]
+        grid = drawin.PointGrid(points, 20)
+        # Consultas al azar y justo en el borde del radio (que no cuenta)
+        queries = [(rng.uniform(-80, 280), rng.uniform(-80, 280)) for _ in range(500)]
+        queries += [(x + dx, y) for x, y in points[:50] for dx in (-20, 20, -19.999, 19.999)]
+        for x, y in queries:
+            expected = any(abs(px - x) < 20 and abs(py - y) < 20 for px, py in points)
+            self.assertEqual(grid.has_neighbor(x, y, 20), expected)
+        for radius in (5, 35, 60):
+            x, y = 100.5, 100.5
+            self.assertEqual(sorted(grid.neighbors(x, y, radius)),
+                             sorted(p for p in points if abs(p[0] - x) < radius and abs(p[1] - y) < radius))
+
+    def test_heart_shape_matches_brute_force(self):
+        recognizer = drawin.DrawinRecognizer()
+        strokes = sample_strokes(4) + [drawin.synthesize_stroke("corazón", n, 1.0, random.Random(n))
+                                        for n in (10, 30, 60, 120)]
+        results = [recognizer.is_heart_shape(points) for points in strokes]
+        self.assertEqual(results, [baseline_heart(points) for points in strokes])
+        self.assertTrue(any(results) and not all(results))
+
+
+class TemplateRecognizerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.recognizer = drawin.TemplateRecognizer()
+        cls.recognizer.prepare()
+
+    def test_each_outline_is_recognized_as_itself(self):
+        for name in drawin.TEMPLATES:
+            outline = drawin.template_display_list(name).outline()
+            (best, score), *_ = self.recognizer.recognize(outline)
+            self.assertEqual(best, name)
+            self.assertAlmostEqual(score, 1.0, places=6)
+            # Ni la posición, ni el tamaño, ni el sentido del trazo importan
+            moved = [(3 * x + 40, 3 * y - 25) for x, y in reversed(outline)]
+            self.assertEqual(self.recognizer.recognize(moved)[0][0], name)
+
+    def test_synthetic_strokes(self):
+        rng = random.Random(5)
+        strokes = [(name, drawin.synthesize_stroke(name, 64, 2.0, rng))
+                   for name in drawin.TEMPLATES for _ in range(6)]
+        hits = sum(self.recognizer.recognize(points)[0][0] == name for name, points in strokes)
+        self.assertGreaterEqual(hits / len(strokes), 0.9)
+
+    def test_ranking(self):
+        points = drawin.synthesize_stroke("casa", 64, 2.0, random.Random(1))
+        ranked = self.recognizer.recognize(points, top=5)
+        self.assertEqual(len(ranked), 5)
+        self.assertEqual(len({name for name, _ in ranked}), 5)
+        scores = [score for _, score in ranked]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertTrue(all(0 <= score <= 1 for score in scores))
+
+    def test_degenerate_strokes_and_batch(self):
+        self.assertEqual(self.recognizer.recognize([(0, 0), (1, 1)]), [])
+        self.assertEqual(self.recognizer.recognize([(5, 5)] * 10), [])
+        strokes = sample_strokes(6)[:40]
+        self.assertEqual(self.recognizer.recognize_batch(strokes),
+                         [self.recognizer.recognize(points) for points in strokes])
+
+
+class PrototypeBankTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "prototipos.bin")
+
+    def test_round_trip(self):
+        drawin.build_prototype_bank(self.path, size=16, samples=3, seed=7)
+        header, bank = drawin.load_prototype_bank(self.path)
+        self.assertEqual(header["classes"], list(drawin.TEMPLATES))
+        self.assertEqual(header["counts"], [5] * len(drawin.TEMPLATES))
+        self.assertEqual(header["fingerprint"], drawin.bank_fingerprint(16, 3, 2.0, 7))
+        self.assertEqual(bank.shape, (5 * len(drawin.TEMPLATES), 16 * 16))
+        self.assertEqual(bank.offset % drawin.BANK_ALIGN, 0)
+        # Cada clase empieza por su contorno, tal cual se rasteriza
+        outlines = [drawin.template_display_list(name).outline() for name in drawin.TEMPLATES]
+        expected = drawin.rasterize_strokes(outlines, 16)
+        for k in range(len(outlines)):
+            self.assertTrue((bank[5 * k] == expected[k]).all())
+        # Se genera igual cada vez
+        drawin.build_prototype_bank(self.path + ".2", size=16, samples=3, seed=7)
+        self.assertTrue((drawin.load_prototype_bank(self.path + ".2")[1] == bank).all())
+
+    def test_not_a_bank(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            drawin.load_prototype_bank(self.path)
+
+    def test_recognizer_reuses_or_rebuilds_the_bank(self):
+        recognizer = drawin.BitmapRecognizer(self.path, size=16, samples=3)
+        recognizer.prepare()
+        built = os.stat(self.path).st_mtime_ns
+        os.utime(self.path, ns=(built - 10**9, built - 10**9))
+        built -= 10**9
+        drawin.BitmapRecognizer(self.path, size=16, samples=3).prepare()
+        self.assertEqual(os.stat(self.path).st_mtime_ns, built)
+        # Otros parámetros de construcción: el banco está desactualizado
+        drawin.BitmapRecognizer(self.path, size=16, samples=4).prepare()
+        self.assertNotEqual(os.stat(self.path).st_mtime_ns, built)
+        self.assertEqual(drawin.load_prototype_bank(self.path)[0]["counts"][0], 6)
+
+    def test_recognize(self):
+        recognizer = drawin.BitmapRecognizer(self.path, size=16, samples=3)
+        outlines = [drawin.template_display_list(name).outline() for name in drawin.TEMPLATES]
+        results = recognizer.recognize_batch(outlines + [[(0, 0), (float("nan"), 1), (2, 2)], [(1, 1)] * 5])
+        self.assertEqual([ranked[0][0] for ranked in results[:-2]], list(drawin.TEMPLATES))
+        self.assertEqual(results[-2:], [[], []])
+        # Uno solo o en lote da lo mismo (salvo el redondeo del producto de matrices)
+        single = recognizer.recognize(outlines[0])
+        self.assertEqual([name for name, _ in single], [name for name, _ in results[0]])
+        for (_, a), (_, b) in zip(single, results[0]):
+            self.assertAlmostEqual(a, b, places=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drawin
+
+
+def record_stroke(recorder, points):
+    recorder.record(drawin.EVENT_PRESS, *points[0])
+    for x, y in points[1:]:
+        recorder.record(drawin.EVENT_MOTION, x, y)
+    recorder.record(drawin.EVENT_RELEASE, *points[-1])
+
+
+SQUARE = [(100, 100), (200, 100), (200, 200), (100, 200), (100, 100)]
+LINE = [(300, 300), (320, 310), (340, 320), (360, 330)]
+
+
+class ReplaySessionTest(unittest.TestCase):
+
+    def replay(self, build):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sesion.drws")
+            recorder = drawin.SessionRecorder(path)
+            build(recorder)
+            recorder.close()
+            return drawin.replay_session(path)
+
+    def test_undo_recognizes_the_remaining_strokes(self):
+        def build(recorder):
+            record_stroke(recorder, SQUARE)
+            record_stroke(recorder, LINE)
+            recorder.record(drawin.EVENT_UNDO)
+            recorder.record(drawin.EVENT_UNDO)
+        results, stats = self.replay(build)
+        # El último deshacer deja el lienzo vacío y no se reconoce nada
+        self.assertEqual([r["event"] for r in results], ["release", "release", "undo"])
+        self.assertEqual([r["strokes"] for r in results], [1, 2, 1])
+        self.assertEqual(results[2]["guess"], results[0]["guess"])
+        self.assertEqual(stats["recognitions"], 3)
+
+    def test_undo_is_ignored_after_transform(self):
+        def build(recorder):
+            record_stroke(recorder, SQUARE)
+            record_stroke(recorder, LINE)
+            recorder.record(drawin.EVENT_TRANSFORM)
+            recorder.record(drawin.EVENT_UNDO)
+            record_stroke(recorder, LINE)
+        results, _ = self.replay(build)
+        self.assertEqual([r["event"] for r in results], ["release", "release", "release"])
+        # Dibujar tras transformar empieza un dibujo nuevo
+        self.assertEqual([r["strokes"] for r in results], [1, 2, 1])
+
+    def test_clear_starts_over(self):
+        def build(recorder):
+            record_stroke(recorder, SQUARE)
+            recorder.record(drawin.EVENT_CLEAR)
+            recorder.record(drawin.EVENT_UNDO)
+            recorder.record(drawin.EVENT_MOTION, 10, 10)
+            recorder.record(drawin.EVENT_RELEASE, 10, 10)
+            record_stroke(recorder, LINE)
+        results, _ = self.replay(build)
+        self.assertEqual([(r["strokes"], r["points"]) for r in results], [(1, 5), (1, 4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
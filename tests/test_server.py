@@ -0,0 +1,78 @@
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import drawin
+
+SQUARE = [[0, 0], [100, 0], [100, 100], [0, 100], [0, 0]]
+
+
+class RecognitionServerTest(unittest.TestCase):
+
+    def ask(self, server, requests):
+        async def scenario():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "drawin.sock")
+                task = asyncio.create_task(server.serve(socket_path=path))
+                while not os.path.exists(path):
+                    await asyncio.sleep(0.01)
+                reader, writer = await asyncio.open_unix_connection(path)
+                replies = []
+                for request in requests:
+                    writer.write((json.dumps(request) + "\n").encode("utf-8"))
+                    await writer.drain()
+                    replies.append(json.loads(await asyncio.wait_for(reader.readline(), 5)))
+                writer.close()
+                task.cancel()
+                return {reply.get("id"): reply for reply in replies}
+
+        return asyncio.run(scenario())
+
+    def test_non_finite_points_are_rejected(self):
+        replies = self.ask(drawin.RecognitionServer(), [
+            {"id": 1, "points": [[0, 0], ["NaN", 1], [2, 2]]},
+            {"id": 2, "points": SQUARE},
+        ])
+        self.assertIn("error", replies[1])
+        self.assertIn("guess", replies[2])
+
+    def test_failed_batch_does_not_stop_the_batcher(self):
+        server = drawin.RecognitionServer()
+        recognize_batch = server.recognize_batch
+        calls = []
+
+        def fail_once(strokes):
+            calls.append(strokes)
+            if len(calls) == 1:
+                raise RuntimeError("fallo")
+            return recognize_batch(strokes)
+
+        server.recognize_batch = fail_once
+        replies = self.ask(server, [{"id": 1, "points": SQUARE},
+                                    {"id": 2, "points": SQUARE}])
+        self.assertEqual(replies[1]["error"], "fallo")
+        self.assertIn("guess", replies[2])
+
+    def test_long_lines(self):
+        # Un trazo de tableta de 6000 puntos cabe en una línea; una línea que
+        # supera el límite recibe un error sin cortar la conexión
+        stroke = [[round(200 + 150 * math.cos(i / 300), 3), round(200 + 150 * math.sin(i / 300), 3)]
+                  for i in range(6000)]
+        replies = self.ask(drawin.RecognitionServer(), [{"id": 1, "points": stroke}])
+        self.assertIn("guess", replies[1])
+        replies = self.ask(drawin.RecognitionServer(max_line_bytes=1024), [
+            {"id": 1, "points": stroke[:500]},
+            {"id": 2, "points": SQUARE},
+        ])
+        self.assertIn("error", replies[None])
+        self.assertIn("guess", replies[2])
+
+
+if __name__ == "__main__":
+    unittest.main()